@@ -1,17 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Response
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Response
 from sqlalchemy.orm import Session
 from app.db.models import Operation
 from app.db.database import get_db
-from datetime import datetime
-from pathlib import Path
-import shutil
+from app.core.visits import (
+    renumber_visits,
+    ensure_visit_str,
+    get_visit_path,
+    invalidate_visit_paths,
+    visit_folder,
+)
+from app.core.storage import get_storage, join_key
+from app.core.exports import archive_entries, zip_response
+from app.core.export_cache import archive_response, invalidate_exports, visit_archive
+from app.core.pagination import filter_date_range, keyset_page
+from app.core.fields import as_fields, query_fields
+from datetime import date, datetime
 from app.db import models
-import zipfile
 from pydantic import BaseModel
 
 router = APIRouter()
 
-DATA_ROOT = Path(r"C:\Users\Pimprenelle\Documents\LymphTrackData")
+
+# Champs calculés par le backend, jamais modifiables via update_operation
+READ_ONLY_FIELDS = {"id_operation", "visit_number", "visit_str"}
+
 
 # ---------------------
 # CREATE OPERATION
@@ -22,8 +34,8 @@ def create_operation(op_data: dict = Body(...), db: Session = Depends(get_db)):
     if not patient_id:
         raise HTTPException(status_code=400, detail="Missing patient_id")
 
-    patient_folder = DATA_ROOT / patient_id
-    if not patient_folder.exists():
+    storage = get_storage()
+    if not storage.is_dir(patient_id):
         raise HTTPException(status_code=404, detail=f"Patient folder {patient_id} not found")
 
     op_date = op_data.get("operation_date")
@@ -50,45 +62,16 @@ def create_operation(op_data: dict = Body(...), db: Session = Depends(get_db)):
     db.add(temp_op)
     db.flush()
 
-    all_ops = (
-        db.query(Operation)
-        .filter(Operation.patient_id == patient_id)
-        .order_by(Operation.operation_date.asc())
-        .all()
-    )
-
-    visit_map = {}
-
-    for i, op in enumerate(all_ops, start=1):
-        visit_str = f"{i}-{op.name.replace(' ', '_')}_{op.operation_date.strftime('%d%m%Y')}"
-        visit_map[op.id_operation] = (i, visit_str)
-        expected_folder = patient_folder / visit_str
-
-        # Trouver un dossier existant avec la même date (peu importe l'ancien index)
-        old_pattern = f"_{op.operation_date.strftime('%d%m%Y')}"
-        existing_folder = None
-        for folder in patient_folder.iterdir():
-            if folder.is_dir() and folder.name.endswith(old_pattern):
-                existing_folder = folder
-                break
-
-        # Si un dossier existe mais que le nom ne correspond plus → on le renomme
-        if existing_folder and existing_folder.name != visit_str:
-            existing_folder.rename(expected_folder)
-
-        # Sinon on le crée s’il n’existe pas
-        expected_folder.mkdir(parents=True, exist_ok=True)
-
-        # Créer les sous-dossiers 1 à 6 si manquants
-        for pos in range(1, 7):
-            (expected_folder / str(pos)).mkdir(exist_ok=True)
+    renumber_visits(db, patient_id)
 
+    # Dossier de la visite (par id, jamais renommé) et sous-dossiers 1 à 6
+    op_folder = visit_folder(patient_id, temp_op.id_operation)
+    for pos in range(1, 7):
+        storage.make_dirs(join_key(op_folder, pos))
 
     db.commit()
     db.refresh(temp_op)
 
-    visit_number, visit_str = visit_map[temp_op.id_operation]
-
     return {
         "status": "success",
         "operation": {
@@ -97,8 +80,8 @@ def create_operation(op_data: dict = Body(...), db: Session = Depends(get_db)):
             "name": temp_op.name,
             "operation_date": temp_op.operation_date,
             "notes": temp_op.notes,
-            "visit_number": visit_number,
-            "visit_str": visit_str,
+            "visit_number": temp_op.visit_number,
+            "visit_str": temp_op.visit_str,
         },
     }
 
@@ -107,25 +90,41 @@ def create_operation(op_data: dict = Body(...), db: Session = Depends(get_db)):
 # READ OPERATION BY ID
 # ---------------------
 @router.get("/{id_operation}")
-def get_operation(id_operation: int, db: Session = Depends(get_db)):
-    op = db.query(Operation).filter(Operation.id_operation == id_operation).first()
+def get_operation(id_operation: int, fields: str | None = Query(None), db: Session = Depends(get_db)):
+    op = query_fields(db, Operation, fields).filter(Operation.id_operation == id_operation).first()
     if not op:
         raise HTTPException(status_code=404, detail="Operation not found")
-    return op
+    return as_fields(op, fields)
 
 # ---------------------
 # READ ALL OPERATIONS BY PATIENT
 # ---------------------
 @router.get("/by_patient/{patient_id}")
-def get_operations_by_patient(patient_id: str, db: Session = Depends(get_db)):
-    return db.query(Operation).filter(Operation.patient_id == patient_id).all()
+def get_operations_by_patient(patient_id: str, fields: str | None = Query(None), db: Session = Depends(get_db)):
+    return as_fields(query_fields(db, Operation, fields).filter(Operation.patient_id == patient_id).all(), fields)
 
 # ---------------------
 # READ ALL OPERATIONS
 # ---------------------
 @router.get("/")
-def get_operations(db: Session = Depends(get_db)):
-    return db.query(Operation).all()
+def get_operations(
+    response: Response,
+    limit: int | None = Query(None),
+    after: int | None = Query(None),
+    patient_id: str | None = Query(None),
+    name: str | None = Query(None),
+    date_from: date | None = Query(None),
+    date_to: date | None = Query(None),
+    fields: str | None = Query(None),
+    db: Session = Depends(get_db),
+):
+    query = query_fields(db, Operation, fields)
+    if patient_id is not None:
+        query = query.filter(Operation.patient_id == patient_id)
+    if name is not None:
+        query = query.filter(Operation.name == name)
+    query = filter_date_range(query, Operation.operation_date, date_from, date_to)
+    return as_fields(keyset_page(query, Operation.id_operation, response, limit, after), fields)
 
 
 # ---------------------
@@ -183,7 +182,7 @@ def update_operation(id_operation: int, updated_data: dict, db: Session = Depend
     old_name, old_date = op.name, op.operation_date
 
     for key, value in updated_data.items():
-        if hasattr(op, key):
+        if hasattr(op, key) and key not in READ_ONLY_FIELDS:
             if key == "operation_date" and isinstance(value, str):
                 value = datetime.fromisoformat(value)
             setattr(op, key, value)
@@ -192,20 +191,10 @@ def update_operation(id_operation: int, updated_data: dict, db: Session = Depend
     db.refresh(op)
 
     if op.name != old_name or op.operation_date != old_date:
-        patient_folder = DATA_ROOT / op.patient_id
-        all_ops = (
-            db.query(Operation)
-            .filter(Operation.patient_id == op.patient_id)
-            .order_by(Operation.operation_date.asc())
-            .all()
-        )
-
-        # Rename folders to maintain order and consistency
-        for i, o in enumerate(all_ops, start=1):
-            old_folder = next(patient_folder.glob(f"*{o.operation_date.strftime('%d%m%Y')}"), None)
-            new_name = f"{i}-{o.name.replace(' ', '_')}_{o.operation_date.strftime('%d%m%Y')}"
-            if old_folder and old_folder.name != new_name:
-                old_folder.rename(patient_folder / new_name)
+        # Seuls les numéros de visite changent, le dossier reste en place
+        renumber_visits(db, op.patient_id)
+        db.commit()
+        db.refresh(op)
 
     return op
 
@@ -221,47 +210,28 @@ def delete_operation(id_operation: int, db: Session = Depends(get_db)):
             raise HTTPException(status_code=404, detail="Operation not found")
 
         patient_id = op.patient_id
-        op_date_str = op.operation_date.strftime("%d%m%Y")
-        patient_folder = DATA_ROOT / patient_id
-
-        op_folder = None
-        for f in patient_folder.glob(f"*{op_date_str}"):
-            if f.is_dir() and op.name.replace(" ", "_") in f.name:
-                op_folder = f
-                break
+        op_folder = visit_folder(patient_id, id_operation)
 
         db.delete(op)
         db.commit()
+        invalidate_visit_paths(id_operation)
+        invalidate_exports(patient_id, id_operation)
 
-        if op_folder and op_folder.exists():
+        storage = get_storage()
+        if storage.is_dir(op_folder):
             try:
-                shutil.rmtree(op_folder)
+                storage.delete_prefix(op_folder)
                 print(f"Dossier supprimé : {op_folder}")
             except Exception as e:
                 print(f"Erreur suppression dossier {op_folder}: {e}")
 
-        remaining_ops = (
-            db.query(models.Operation)
-            .filter(models.Operation.patient_id == patient_id)
-            .order_by(models.Operation.operation_date.asc())
-            .all()
-        )
-
-        for i, o in enumerate(remaining_ops, start=1):
-            old_folder = next(patient_folder.glob(f"*{o.operation_date.strftime('%d%m%Y')}"), None)
-            if old_folder:
-                new_name = f"{i}-{o.name.replace(' ', '_')}_{o.operation_date.strftime('%d%m%Y')}"
-                if old_folder.name != new_name:
-                    try:
-                        old_folder.rename(patient_folder / new_name)
-                        print(f"Dossier renommé : {old_folder.name} → {new_name}")
-                    except Exception as e:
-                        print(f"Erreur renommage {old_folder}: {e}")
+        renumber_visits(db, patient_id)
+        db.commit()
 
         return {
             "status": "success",
             "message": f"Operation {id_operation} deleted successfully",
-            "deleted_folder": str(op_folder) if op_folder else None
+            "deleted_folder": op_folder
         }
 
     except HTTPException:
@@ -280,36 +250,16 @@ def export_operation_folder(id_operation: int, db: Session = Depends(get_db)):
     if not op:
         raise HTTPException(status_code=404, detail="Operation not found")
 
-    patient_folder = DATA_ROOT / op.patient_id
     visit_str = f"{op.name.replace(' ', '_')}_{op.operation_date.strftime('%d%m%Y')}"
-    op_folder = next(patient_folder.glob(f"*{op.operation_date.strftime('%d%m%Y')}"), None)
-    if not op_folder or not op_folder.exists():
+    try:
+        op_folder = get_visit_path(db, id_operation)
+    except HTTPException:
         raise HTTPException(status_code=404, detail=f"No folder found for operation {visit_str}")
 
-    backend_dir = Path(__file__).resolve().parent
-    output_zip = backend_dir / f"{op.patient_id}_{visit_str}.zip"
-
-    try:
-        with zipfile.ZipFile(output_zip, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for file_path in op_folder.rglob("*"):
-                if file_path.is_file():
-                    rel_path = file_path.relative_to(DATA_ROOT)
-                    zipf.write(file_path, rel_path)
-
-        with open(output_zip, "rb") as f:
-            content = f.read()
-
-        return Response(
-            content=content,
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename={output_zip.name}",
-                "Content-Type": "application/octet-stream",
-            },
-        )
-    finally:
-        if output_zip.exists():
-            output_zip.unlink()
+    visit_names = {str(id_operation): ensure_visit_str(db, op)}
+    files = get_storage().list_files(op_folder, recursive=True)
+    archive = visit_archive(op.patient_id, str(id_operation), archive_entries(files, visit_names))
+    return archive_response(archive, f"{op.patient_id}_{visit_str}.zip")
 
 # ---------------------
 # EXPORT POSITION FOLDER
@@ -320,37 +270,16 @@ def export_position_folder(id_operation: int, position: int, db: Session = Depen
     if not op:
         raise HTTPException(status_code=404, detail="Operation not found")
 
-    patient_folder = DATA_ROOT / op.patient_id
-    op_folder = next(patient_folder.glob(f"*{op.operation_date.strftime('%d%m%Y')}"), None)
-    if not op_folder or not op_folder.exists():
+    op_folder = visit_folder(op.patient_id, id_operation)
+    if not get_storage().is_dir(op_folder):
         raise HTTPException(status_code=404, detail=f"Operation folder not found for {op.name}")
 
-    position_folder = op_folder / str(position)
-    if not position_folder.exists():
+    try:
+        position_folder = get_visit_path(db, id_operation, position)
+    except HTTPException:
         raise HTTPException(status_code=404, detail=f"Position folder {position} not found")
 
-    backend_dir = Path(__file__).resolve().parent
+    visit_names = {str(id_operation): ensure_visit_str(db, op)}
     filename = f"{op.patient_id}_{op.name.replace(' ', '_')}_{op.operation_date.strftime('%d%m%Y')}_pos{position}.zip"
-    output_zip = backend_dir / filename
-
-    try:
-        with zipfile.ZipFile(output_zip, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for file_path in position_folder.rglob("*"):
-                if file_path.is_file():
-                    rel_path = file_path.relative_to(DATA_ROOT)
-                    zipf.write(file_path, rel_path)
-
-        with open(output_zip, "rb") as f:
-            content = f.read()
-
-        return Response(
-            content=content,
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}",
-                "Content-Type": "application/octet-stream",
-            },
-        )
-    finally:
-        if output_zip.exists():
-            output_zip.unlink()
+    files = get_storage().list_files(position_folder, recursive=True)
+    return zip_response(archive_entries(files, visit_names), filename)
@@ -1,19 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.db import models
 from app.db.database import get_db
-import io
-import zipfile
-import os
-import shutil
+from app.core.visits import invalidate_visit_paths, visit_export_names
+from app.core.storage import get_storage
+from app.core.exports import archive_entries, zip_response
+from app.core.export_cache import archive_response, invalidate_exports, patient_archive
+from app.core.cohort import COHORT_FORMATS, iter_cohort
+from app.core.pagination import keyset_page
+from app.core.fields import as_fields, query_fields
 from pydantic import BaseModel
-from pathlib import Path
 
 router = APIRouter()
 
-# Dossier racine des patients
-DATA_ROOT = Path(r"C:\Users\Pimprenelle\Documents\LymphTrackData")
-
 # ---------------------
 # CREATE PATIENT
 # ---------------------
@@ -55,8 +55,7 @@ def create_patient(patient: dict, db: Session = Depends(get_db)):
     db.refresh(new_patient)
 
     try:
-        patient_folder = DATA_ROOT / patient_id
-        patient_folder.mkdir(parents=True, exist_ok=True)
+        get_storage().make_dirs(patient_id)
     except OSError as e:
         raise HTTPException(status_code=500, detail=f"Erreur de création de dossier pour {patient_id}")
 
@@ -66,19 +65,32 @@ def create_patient(patient: dict, db: Session = Depends(get_db)):
 # GET PATIENT
 # ---------------------
 @router.get("/{patient_id}")
-def get_patient(patient_id: str, db: Session = Depends(get_db)):
-    patient = db.query(models.SickPatient).filter(models.SickPatient.patient_id == patient_id).first()
+def get_patient(patient_id: str, fields: str | None = Query(None), db: Session = Depends(get_db)):
+    patient = query_fields(db, models.SickPatient, fields).filter(models.SickPatient.patient_id == patient_id).first()
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
-    return patient
+    return as_fields(patient, fields)
 
 
 # ---------------------
 # GET ALL PATIENTS
 # ---------------------
 @router.get("/")
-def get_patients(db: Session = Depends(get_db)):
-    return db.query(models.SickPatient).all()
+def get_patients(
+    response: Response,
+    limit: int | None = Query(None),
+    after: str | None = Query(None),
+    gender: int | None = Query(None),
+    lymphedema_side: int | None = Query(None),
+    fields: str | None = Query(None),
+    db: Session = Depends(get_db),
+):
+    query = query_fields(db, models.SickPatient, fields)
+    if gender is not None:
+        query = query.filter(models.SickPatient.gender == gender)
+    if lymphedema_side is not None:
+        query = query.filter(models.SickPatient.lymphedema_side == lymphedema_side)
+    return as_fields(keyset_page(query, models.SickPatient.patient_id, response, limit, after), fields)
 
 
 # ---------------------
@@ -109,21 +121,28 @@ def delete_patient(patient_id: str, db: Session = Depends(get_db)):
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
 
+    op_ids = [
+        id_op for (id_op,) in
+        db.query(models.Operation.id_operation).filter(models.Operation.patient_id == patient_id).all()
+    ]
+
     db.delete(patient)
     db.commit()
+    invalidate_visit_paths(*op_ids)
+    invalidate_exports(patient_id)
 
-    patient_folder = DATA_ROOT / patient_id
+    storage = get_storage()
     deleted_files = []
 
     try:
-        if patient_folder.exists():
-            shutil.rmtree(patient_folder)
-            deleted_files.append(str(patient_folder.resolve()))
-            print(f"Dossier supprimé : {patient_folder.resolve()}")
+        if storage.is_dir(patient_id):
+            storage.delete_prefix(patient_id)
+            deleted_files.append(patient_id)
+            print(f"Dossier supprimé : {patient_id}")
         else:
             print(f"Aucun dossier à supprimer pour {patient_id}")
     except Exception as e:
-        print(f"Erreur lors de la suppression du dossier {patient_folder}: {e}")
+        print(f"Erreur lors de la suppression du dossier {patient_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Error deleting folder for {patient_id}: {str(e)}")
 
     return {
@@ -137,39 +156,16 @@ def delete_patient(patient_id: str, db: Session = Depends(get_db)):
 # EXPORT PATIENT FOLDER
 # ---------------------
 @router.get("/export-folder/{patient_id}")
-def export_patient_folder(patient_id: str):
-    patient_folder = DATA_ROOT / patient_id
-    if not patient_folder.exists():
+def export_patient_folder(patient_id: str, db: Session = Depends(get_db)):
+    storage = get_storage()
+    if not storage.is_dir(patient_id):
         raise HTTPException(status_code=404, detail=f"No folder found for {patient_id}")
 
-    backend_dir = Path(__file__).resolve().parent
-    output_zip = backend_dir / f"{patient_id}.zip"
+    files = storage.list_files(patient_id, recursive=True)
 
-    try:
-        with zipfile.ZipFile(output_zip, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for file_path in patient_folder.rglob("*"):
-                if file_path.is_file():
-                    rel_path = file_path.relative_to(DATA_ROOT)
-                    zipf.write(file_path, rel_path)
-
-        with open(output_zip, "rb") as f:
-            content = f.read()
-
-        return Response(
-            content=content,
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename={patient_id}.zip",
-                "Content-Type": "application/octet-stream"
-            },
-        )
-    finally:
-        if output_zip.exists():
-            try:
-                output_zip.unlink()
-                print(f"Deleted temporary file: {output_zip}")
-            except Exception as e:
-                print(f"Failed to delete temporary zip {output_zip}: {e}")
+    visit_names = visit_export_names(db, patient_id)
+    archive = patient_archive(patient_id, archive_entries(files, visit_names))
+    return archive_response(archive, f"{patient_id}.zip")
 
 
 # ---------------------
@@ -179,40 +175,37 @@ class PatientsExportRequest(BaseModel):
     patient_ids: list[str]
 
 @router.post("/export-multiple/")
-def export_multiple_patients(request: PatientsExportRequest):
+def export_multiple_patients(request: PatientsExportRequest, db: Session = Depends(get_db)):
     patient_ids = request.patient_ids
     if not patient_ids:
         raise HTTPException(status_code=400, detail="No patient IDs provided")
 
-    backend_dir = Path(__file__).resolve().parent
-    output_zip = backend_dir / f"patients_export_{len(patient_ids)}.zip"
+    # Listes et noms de visites résolus avant l'envoi : le générateur ne touche plus à la session
+    entries = []
+    for pid in patient_ids:
+        files = get_storage().list_files(pid, recursive=True)
+        if files:
+            entries.extend(archive_entries(files, visit_export_names(db, pid)))
 
-    try:
-        with zipfile.ZipFile(output_zip, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for pid in patient_ids:
-                folder_path = DATA_ROOT / pid
-                if not folder_path.exists():
-                    continue
-                for file_path in folder_path.rglob("*"):
-                    if file_path.is_file():
-                        rel_path = file_path.relative_to(DATA_ROOT)
-                        zipf.write(file_path, rel_path)
-
-        with open(output_zip, "rb") as f:
-            content = f.read()
-
-        return Response(
-            content=content,
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename={output_zip.name}",
-                "Content-Type": "application/octet-stream"
-            },
-        )
-    finally:
-        if output_zip.exists():
-            try:
-                output_zip.unlink()
-                print(f"Deleted temporary file: {output_zip}")
-            except Exception as e:
-                print(f"Failed to delete temporary zip {output_zip}: {e}")
\ No newline at end of file
+    return zip_response(entries, f"patients_export_{len(patient_ids)}.zip")
+
+
+# ---------------------
+# EXPORT COHORT (PARQUET / ARROW)
+# ---------------------
+class CohortExportRequest(BaseModel):
+    patient_ids: list[str] | None = None
+    format: str = "parquet"
+
+@router.post("/export-cohort/")
+def export_cohort(request: CohortExportRequest):
+    if request.format not in COHORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{request.format}', expected one of {COHORT_FORMATS}")
+
+    extension = "parquet" if request.format == "parquet" else "arrows"
+    media_type = "application/vnd.apache.parquet" if request.format == "parquet" else "application/vnd.apache.arrow.stream"
+    return StreamingResponse(
+        iter_cohort(request.patient_ids, request.format),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=cohort.{extension}"},
+    )
@@ -1,63 +1,62 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request, Query
 from sqlalchemy.orm import Session
 from app.db.models import Photo, Operation
 from app.db.database import get_db
+from app.core.visits import ensure_visit_str, get_visit_path
+from app.core.storage import get_storage, join_key, sha256_stream
+from app.core.file_responses import file_etag, stored_file_response
+from app.core.thumbnails import (
+    THUMBNAIL_SIZES,
+    delete_thumbnails,
+    ensure_thumbnail,
+    list_thumbnails,
+    schedule_thumbnails,
+    thumbnail_sizes,
+)
+from app.core.exports import zip_response
 from datetime import datetime, timezone
-from pathlib import Path
-import os, re, shutil, logging
+import re, logging
 import base64
-import tempfile, zipfile
 
 router = APIRouter()
-DATA_ROOT = Path(r"C:\Users\Pimprenelle\Documents\LymphTrackData")
 
 # ---------------------
 # UPLOAD PHOTO
 # ---------------------
+def photo_payload(photo: Photo) -> dict:
+    return {"id": photo.id, "filename": photo.filename, "created_at": photo.created_at.isoformat()}
+
+
 @router.post("/upload/{id_operation}")
 def upload_photo(id_operation: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
-    op = db.query(Operation).filter(Operation.id_operation == id_operation).first()
-    if not op:
-        raise HTTPException(status_code=404, detail="Operation not found")
-
-    patient_id = op.patient_id
-    all_ops = (
-        db.query(Operation)
-        .filter(Operation.patient_id == patient_id)
-        .order_by(Operation.operation_date.asc())
-        .all()
-    )
-    visit_number = {o.id_operation: idx + 1 for idx, o in enumerate(all_ops)}[op.id_operation]
-    visit_str = f"{visit_number}-{op.name.replace(' ', '_')}_{op.operation_date.strftime('%d%m%Y')}"
+    photos_dir = join_key(get_visit_path(db, id_operation, create=True), "photos")
 
-    photos_dir = DATA_ROOT / patient_id / visit_str / "photos"
-    photos_dir.mkdir(parents=True, exist_ok=True)
+    # Même image déjà envoyée pour cette opération : on renvoie la photo existante
+    digest = sha256_stream(file.file)
+    existing = db.query(Photo).filter(Photo.id_operation == id_operation, Photo.sha256 == digest).first()
+    if existing:
+        return {"status": "success", "duplicate": True, "photo": photo_payload(existing)}
 
     safe_filename = re.sub(r'[^a-zA-Z0-9_.-]', '_', file.filename or "photo.jpg")
-    save_path = photos_dir / safe_filename
+    save_path = join_key(photos_dir, safe_filename)
 
     try:
-        with open(save_path, "wb") as out_file:
-            shutil.copyfileobj(file.file, out_file)
+        get_storage().save(save_path, file.file)
     except Exception as e:
-        if save_path.exists():
-            save_path.unlink()
         raise HTTPException(status_code=500, detail=f"Error saving photo: {e}")
 
-    new_photo = Photo(id_operation=id_operation, filename=safe_filename, created_at=datetime.now(timezone.utc))
+    new_photo = Photo(
+        id_operation=id_operation,
+        filename=safe_filename,
+        created_at=datetime.now(timezone.utc),
+        sha256=digest,
+    )
     db.add(new_photo)
     db.commit()
     db.refresh(new_photo)
+    schedule_thumbnails([save_path])
 
-    return {
-        "status": "success",
-        "photo": {
-            "id": new_photo.id,
-            "filename": new_photo.filename,
-            "created_at": new_photo.created_at.isoformat(),
-        },
-    }
+    return {"status": "success", "duplicate": False, "photo": photo_payload(new_photo)}
 
 
 # ---------------------
@@ -65,94 +64,152 @@ def upload_photo(id_operation: int, file: UploadFile = File(...), db: Session =
 # ---------------------
 @router.post("/upload-multiple/{id_operation}")
 def upload_multiple_photos(id_operation: int, files: list[UploadFile] = File(...), db: Session = Depends(get_db)):
-    op = db.query(Operation).filter(Operation.id_operation == id_operation).first()
-    if not op:
-        raise HTTPException(status_code=404, detail="Operation not found")
-
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
 
-    patient_id = op.patient_id
-    all_ops = (
-        db.query(Operation)
-        .filter(Operation.patient_id == patient_id)
-        .order_by(Operation.operation_date.asc())
-        .all()
-    )
+    photos_dir = join_key(get_visit_path(db, id_operation, create=True), "photos")
 
-    visit_number = {o.id_operation: idx + 1 for idx, o in enumerate(all_ops)}[op.id_operation]
-    visit_str = f"{visit_number}-{op.name.replace(' ', '_')}_{op.operation_date.strftime('%d%m%Y')}"
-    photos_dir = DATA_ROOT / patient_id / visit_str / "photos"
-    photos_dir.mkdir(parents=True, exist_ok=True)
+    seen = {
+        digest for (digest,) in
+        db.query(Photo.sha256).filter(Photo.id_operation == id_operation, Photo.sha256.isnot(None)).all()
+    }
 
-    saved_photos = []
+    saved_photos, saved_keys, duplicates = [], [], []
     for file in files:
+        digest = sha256_stream(file.file)
+        if digest in seen:
+            duplicates.append(file.filename)
+            continue
+        seen.add(digest)
+
         safe_filename = re.sub(r'[^a-zA-Z0-9_.-]', '_', file.filename or "photo.jpg")
-        save_path = photos_dir / safe_filename
+        save_path = join_key(photos_dir, safe_filename)
 
         try:
-            with open(save_path, "wb") as out_file:
-                shutil.copyfileobj(file.file, out_file)
+            get_storage().save(save_path, file.file)
         except Exception as e:
-            if save_path.exists():
-                save_path.unlink()
             logging.error(f"Failed to save {file.filename}: {e}")
             continue
 
         new_photo = Photo(
             id_operation=id_operation,
             filename=safe_filename,
-            created_at=datetime.now(timezone.utc)
+            created_at=datetime.now(timezone.utc),
+            sha256=digest,
         )
         db.add(new_photo)
         saved_photos.append(new_photo)
+        saved_keys.append(save_path)
 
     db.commit()
+    schedule_thumbnails(saved_keys)
 
     return {
         "status": "success",
         "message": f"{len(saved_photos)} photo(s) uploaded successfully",
-        "photos": [
-            {"id": p.id, "filename": p.filename, "created_at": p.created_at.isoformat()}
-            for p in saved_photos
-        ]
+        "photos": [photo_payload(p) for p in saved_photos],
+        "skipped_duplicates": duplicates,
     }
 
 
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+
+
+def existing_photos_dir(db: Session, id_operation: int) -> str | None:
+    # Lecture seule : ne crée jamais le dossier de visite (None s'il n'existe pas encore)
+    try:
+        visit_dir = get_visit_path(db, id_operation)
+    except HTTPException:
+        if not db.query(Operation.id_operation).filter(Operation.id_operation == id_operation).first():
+            raise
+        return None
+    return join_key(visit_dir, "photos")
+
+
+def photo_key(db: Session, id_operation: int, filename: str) -> str | None:
+    if "/" in filename or "\\" in filename or filename in ("", ".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    photos_dir = existing_photos_dir(db, id_operation)
+    return join_key(photos_dir, filename) if photos_dir else None
+
+
+# ---------------------
+# LIST PHOTOS (METADATA ONLY)
+# ---------------------
+@router.get("/list/{id_operation}")
+def list_photos(id_operation: int, db: Session = Depends(get_db)):
+    photos_dir = existing_photos_dir(db, id_operation)
+    if photos_dir is None:
+        return {"status": "success", "photos": []}
+    rows = {p.filename: p for p in db.query(Photo).filter(Photo.id_operation == id_operation).all()}
+    # Vignettes existantes seulement : en cours de génération ou écartées, "url" sert l'original
+    thumbs = list_thumbnails(photos_dir)
+
+    photos = []
+    for f in get_storage().list_files(photos_dir):
+        if f.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        row = rows.get(f.name)
+        photos.append({
+            "id": row.id if row else None,
+            "filename": f.name,
+            "created_at": row.created_at.isoformat() if row and row.created_at else None,
+            "size": f.size,
+            "etag": file_etag(f),
+            "url": f"/photos/file/{id_operation}/{f.name}",
+            "thumbnails": {
+                str(size): f"/photos/file/{id_operation}/{f.name}?size={size}" for size in thumbnail_sizes(f, thumbs)
+            },
+        })
+
+    return {"status": "success", "photos": photos}
+
+
+# ---------------------
+# GET ONE PHOTO (STREAMED)
+# ---------------------
+@router.get("/file/{id_operation}/{filename}")
+def get_photo_file(
+    id_operation: int,
+    filename: str,
+    request: Request,
+    size: int | None = Query(default=None),
+    db: Session = Depends(get_db),
+):
+    if size is not None and size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {list(THUMBNAIL_SIZES)}")
+
+    key = photo_key(db, id_operation, filename)
+    stored = get_storage().stat(key) if key else None
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Photo not found")
+
+    if size is not None:
+        stored = ensure_thumbnail(stored, size)
+    return stored_file_response(request, stored)
+
+
 # ---------------------
 # GET ALL PHOTOS BY OPERATION
 # ---------------------
+# Images complètes en base64 : conservé pour l'écran de suivi actuel, préférer
+# /list + /file qui permettent le chargement à la demande et le cache navigateur.
 @router.get("/photos/{id_operation}")
 def get_photos(id_operation: int, db: Session = Depends(get_db)):
-    op = db.query(Operation).filter(Operation.id_operation == id_operation).first()
-    if not op:
-        raise HTTPException(status_code=404, detail="Operation not found")
-
-    patient_id = op.patient_id
-    all_ops = (
-        db.query(Operation)
-        .filter(Operation.patient_id == patient_id)
-        .order_by(Operation.operation_date.asc())
-        .all()
-    )
-    visit_number = {o.id_operation: idx + 1 for idx, o in enumerate(all_ops)}[op.id_operation]
-    visit_str = f"{visit_number}-{op.name.replace(' ', '_')}_{op.operation_date.strftime('%d%m%Y')}"
-
-    photos_dir = DATA_ROOT / patient_id / visit_str / "photos"
-    if not photos_dir.exists():
+    storage = get_storage()
+    photos_dir = existing_photos_dir(db, id_operation)
+    if photos_dir is None:
         return {"status": "success", "photos": []}
 
-    image_extensions = (".jpg", ".jpeg", ".png", ".webp", ".gif")
     photos = []
 
-    for f in photos_dir.iterdir():
-        if f.is_file() and f.suffix.lower() in image_extensions:
-            with open(f, "rb") as img_file:
-                encoded = base64.b64encode(img_file.read()).decode("utf-8")
-                photos.append({
-                    "filename": f.name,
-                    "image_base64": f"data:image/{f.suffix[1:]};base64,{encoded}"
-                })
+    for f in storage.list_files(photos_dir):
+        if f.suffix.lower() in IMAGE_EXTENSIONS:
+            encoded = base64.b64encode(storage.read_bytes(f.key)).decode("utf-8")
+            photos.append({
+                "filename": f.name,
+                "image_base64": f"data:image/{f.suffix[1:]};base64,{encoded}"
+            })
 
     return {"status": "success", "photos": photos}
 
@@ -164,21 +221,7 @@ def get_photos(id_operation: int, db: Session = Depends(get_db)):
 @router.delete("/photos/{id_operation}/{filename}")
 def delete_photo(id_operation: int, filename: str, db: Session = Depends(get_db)):
     try:
-        op = db.query(Operation).filter(Operation.id_operation == id_operation).first()
-        if not op:
-            raise HTTPException(status_code=404, detail="Operation not found")
-
-        patient_id = op.patient_id
-        all_ops = (
-            db.query(Operation)
-            .filter(Operation.patient_id == patient_id)
-            .order_by(Operation.operation_date.asc())
-            .all()
-        )
-        visit_number = {o.id_operation: idx + 1 for idx, o in enumerate(all_ops)}[op.id_operation]
-        visit_str = f"{visit_number}-{op.name.replace(' ', '_')}_{op.operation_date.strftime('%d%m%Y')}"
-
-        photo_path = DATA_ROOT / patient_id / visit_str / "photos" / filename
+        photo_path = photo_key(db, id_operation, filename)
 
         photo = (
             db.query(Photo)
@@ -188,9 +231,11 @@ def delete_photo(id_operation: int, filename: str, db: Session = Depends(get_db)
         if not photo:
             raise HTTPException(status_code=404, detail="Photo not found in database")
 
-        if photo_path.exists():
+        storage = get_storage()
+        if photo_path and storage.exists(photo_path):
             try:
-                photo_path.unlink()
+                storage.delete(photo_path)
+                delete_thumbnails(photo_path)
             except Exception as e:
                 raise HTTPException(status_code=500, detail=f"Failed to delete file: {e}")
 
@@ -217,29 +262,11 @@ def export_all_photos(id_operation: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Operation not found")
 
     patient_id = op.patient_id
-    all_ops = (
-        db.query(Operation)
-        .filter(Operation.patient_id == patient_id)
-        .order_by(Operation.operation_date.asc())
-        .all()
-    )
-    visit_number = {o.id_operation: idx + 1 for idx, o in enumerate(all_ops)}[op.id_operation]
-    visit_str = f"{visit_number}-{op.name.replace(' ', '_')}_{op.operation_date.strftime('%d%m%Y')}"
+    visit_str = ensure_visit_str(db, op)
 
-    photos_dir = DATA_ROOT / patient_id / visit_str / "photos"
-    if not photos_dir.exists() or not any(photos_dir.iterdir()):
+    photos_dir = existing_photos_dir(db, id_operation)
+    files = get_storage().list_files(photos_dir) if photos_dir else []
+    if not files:
         raise HTTPException(status_code=404, detail="No photos found for this operation")
 
-    tmp_zip = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
-    with zipfile.ZipFile(tmp_zip, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for f in photos_dir.iterdir():
-            if f.is_file():
-                zipf.write(f, arcname=f.name)
-
-    tmp_zip.close()
-
-    return FileResponse(
-        path=tmp_zip.name,
-        filename=f"{patient_id}_{visit_str}_photos.zip",
-        media_type="application/zip"
-    )
+    return zip_response([(f, f.name) for f in files], f"{patient_id}_{visit_str}_photos.zip")
@@ -1,218 +1,264 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query, Response
+from sqlalchemy import and_, func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.db.models import Result, Operation
+from app.db.models import Result, ResultCurve, Operation, PositionAverage
 from app.db.database import get_db
-
-import os, re, tempfile, traceback, shutil
-import pandas as pd
+from app.core import curve_cache
+from app.core.measurements import parse_measurement, analyse_measurement, decode_curve
+from app.core.workers import get_parse_pool
+from app.core.downsampling import downsample_frame
+from app.core.visits import ensure_visit_str, renumber_visits, get_visit_path, visit_folder
+from app.core.storage import StoredFile, get_storage, join_key, sha256_stream
+from app.core.pagination import filter_date_range, keyset_page
+from app.core.fields import as_fields, query_fields
+from app.core.averages import (
+    add_to_position_average,
+    discard_from_position_average,
+    average_curve,
+    load_position_averages,
+    store_position_average,
+)
+
+import io, re, traceback, hashlib
 import numpy as np
-from pathlib import Path
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
+from typing import Literal
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-DATA_ROOT = Path(r"C:\Users\Pimprenelle\Documents\LymphTrackData")
-
 # ---------------------
 # Utility functions
 # ---------------------
 
-def get_visit_path(db: Session, id_operation: int, position: int | None = None) -> Path:
-    operation = db.query(Operation).filter(Operation.id_operation == id_operation).first()
-    if not operation:
-        raise HTTPException(status_code=404, detail=f"Operation {id_operation} not found")
+def read_measurement_file(stored: StoredFile):
+    cached = curve_cache.load_curve(stored)
+    if cached is not None:
+        return cached
 
-    patient_id = operation.patient_id
-    all_ops = (
-        db.query(Operation)
-        .filter(Operation.patient_id == patient_id)
-        .order_by(Operation.operation_date.asc())
-        .all()
-    )
+    content = get_storage().read_bytes(stored.key)
+    curve = parse_measurement(io.BytesIO(content), stored.key)
+    if curve is None:
+        logging.warning(f"[PLOT READ] {stored.key}: no usable sweep")
+        return None
 
-    if not all_ops:
-        raise HTTPException(status_code=404, detail=f"No operations found for patient {patient_id}")
+    curve_cache.store_curve(stored, *curve)
+    return curve
 
-    visit_number = {op.id_operation: idx + 1 for idx, op in enumerate(all_ops)}[id_operation]
-    visit_name = operation.name.replace(" ", "_")
-    visit_str = f"{visit_number}-{visit_name}_{operation.operation_date.strftime('%d%m%Y')}"
 
-    visit_dir = DATA_ROOT / patient_id / visit_str
-    if position is not None:
-        visit_dir = visit_dir / str(position)
+def _padded_losses(measure_arrays: list[tuple], length: int) -> np.ndarray:
+    losses = np.full((len(measure_arrays), length), np.nan)
+    for m_index, (_, loss) in enumerate(measure_arrays):
+        n = min(length, len(loss))
+        losses[m_index, :n] = loss[:n]
+    return losses
 
-    if not visit_dir.exists():
-        raise HTTPException(status_code=404, detail=f"Visit folder not found: {visit_dir}")
 
-    return visit_dir
+# Les helpers merge_* renvoient une "frame" (freqs en GHz, {série: pertes}), NaN
+# là où une série n'a pas de point ; render_chart la sérialise au format demandé.
 
+def _series_to_list(values: np.ndarray) -> list:
+    nan_mask = np.isnan(values)
+    if not nan_mask.any():
+        return values.tolist()
+    out = values.astype(object)
+    out[nan_mask] = None
+    return out.tolist()
 
-def infer_header_and_data(raw_df, key_cols, max_header_row=10):
-    for idx in range(min(max_header_row, len(raw_df))):
-        header = raw_df.iloc[idx].astype(str)
-        cols = header.str.lower().str.replace(r"\s+", "", regex=True)
-        if all(any(k in c for c in cols) for k in key_cols):
-            df = raw_df.iloc[idx+1:].copy()
-            df.columns = cols
-            return df
-    return None
 
+def frame_to_rows(freqs_ghz: np.ndarray, series: dict[str, np.ndarray]):
+    columns = {key: values.tolist() for key, values in series.items()}
+    merged = []
 
-def read_measurement_file(file_path: str):
-    file_path = str(file_path)
-    suffix = file_path.split(".")[-1].lower()
+    for idx, freq in enumerate(freqs_ghz.tolist()):
+        point = {"freq": freq}
+        for key, values in columns.items():
+            value = values[idx]
+            if value == value:  # NaN : pas de point pour cette série
+                point[key] = value
+        merged.append(point)
 
-    try:
-        if suffix == "csv":
-            try:
-                tmp = pd.read_csv(file_path, header=0, sep=None, engine="python")
-                cols = tmp.columns.astype(str).str.strip().str.lower().str.replace(r"\s+", "", regex=True)
-                if any("freq" in c for c in cols) and any("s11" in c or "returnloss" in c for c in cols):
-                    df = tmp.copy()
-                    df.columns = cols
-                else:
-                    raw = pd.read_csv(file_path, header=None, sep=None, engine="python")
-                    df = infer_header_and_data(raw, key_cols=["freq", "returnloss"])
-            except Exception:
-                logging.warning(f"[PLOT READ] CSV read failed for {file_path}")
-                return []
-        else:
-            try:
-                tmp = pd.read_excel(file_path, header=0)
-                cols = tmp.columns.astype(str).str.strip().str.lower().str.replace(r"\s+", "", regex=True)
-                if any("freq" in c for c in cols) and any("s11" in c or "returnloss" in c for c in cols):
-                    df = tmp.copy()
-                    df.columns = cols
-                else:
-                    raw = pd.read_excel(file_path, header=None)
-                    df = infer_header_and_data(raw, key_cols=["freq", "returnloss"])
-            except Exception:
-                logging.warning(f"[PLOT READ] Excel read failed for {file_path}")
-                return []
-    except Exception as e:
-        logging.warning(f"[PLOT READ] {file_path}: unexpected read error {e}")
-        return []
+    return merged
 
-    if df is None:
-        logging.warning(f"[PLOT READ] {file_path}: could not infer header")
-        return []
 
-    df.columns = df.columns.astype(str).str.strip().str.lower().str.replace(r"\s+", "", regex=True)
-    freq_cols = [c for c in df.columns if "freq" in c]
-    rl_cols = [c for c in df.columns if "s11" in c or "returnloss" in c]
-    if not freq_cols or not rl_cols:
-        logging.warning(f"[PLOT READ] {file_path}: missing freq or return loss cols")
-        return []
+def frame_to_columnar(freqs_ghz: np.ndarray, series: dict[str, np.ndarray]):
+    return {
+        "freq": freqs_ghz.tolist(),
+        "series": {key: _series_to_list(values) for key, values in series.items()},
+    }
 
-    freq_col, rl_col = freq_cols[0], rl_cols[0]
 
-    df_vals = df[[freq_col, rl_col]].astype(str).map(lambda x: x.replace(",", "."))
-    df_sub = df_vals.apply(pd.to_numeric, errors="coerce").dropna()
+def render_chart(frame, format: str = "rows"):
+    if format == "columnar":
+        return frame_to_columnar(*frame) if frame else {"freq": [], "series": {}}
+    return frame_to_rows(*frame) if frame else []
 
-    if df_sub.empty:
-        logging.warning(f"[PLOT READ] {file_path}: no numeric data after coercion")
-        return []
 
-    data_points = [
-        {"freq_hz": float(row[freq_col]), "loss_db": float(row[rl_col])}
-        for _, row in df_sub.iterrows()
-    ]
+def merge_measurements_for_chart(measure_arrays: list[tuple]):
+    if not measure_arrays or not len(measure_arrays[0][0]):
+        return None
 
-    return data_points
+    freqs = measure_arrays[0][0]
+    losses = _padded_losses(measure_arrays, len(freqs))
+    series = {f"loss{m_index + 1}": losses[m_index] for m_index in range(len(measure_arrays))}
 
+    return freqs / 1e9, series
 
-def merge_measurements_for_chart(measure_arrays: list[list[dict]]):
-    if not measure_arrays or not measure_arrays[0]:
-        return []
+def merge_visits_for_chart(visit_curves: dict[str, tuple]):
+    if not visit_curves:
+        return None
 
-    length = len(measure_arrays[0])
-    merged = []
+    freqs_ghz = {key: freqs_hz / 1e9 for key, (freqs_hz, _) in visit_curves.items()}
 
-    for idx in range(length):
-        point = {}
-        freq_hz = measure_arrays[0][idx]["freq_hz"]
-        point["freq"] = freq_hz / 1e9 
+    # Créer une grille de fréquences commune (en GHz), une seule fois.
+    # Les visites partagent en général la même grille VNA : on déduplique avant
+    # d'arrondir avec round() pour garder exactement la grille d'origine.
+    unique_freqs = np.unique(np.concatenate(list(freqs_ghz.values())))
+    grid = np.unique(np.array([round(f, 6) for f in unique_freqs.tolist()], dtype=np.float64))
+    series = {}
 
-        for m_index, arr in enumerate(measure_arrays):
-            if idx < len(arr):
-                point[f"loss{m_index + 1}"] = arr[idx]["loss_db"]
+    # Interpoler chaque visite sur toute la grille en un seul appel
+    for idx, (key, (_, losses)) in enumerate(visit_curves.items(), start=1):
+        freqs = freqs_ghz[key]
+        if len(freqs) > 1:
+            series[f"visit{idx}"] = np.interp(grid, freqs, losses)
 
-        merged.append(point)
+    return grid, series
 
-    return merged
 
-def merge_visits_for_chart(visit_curves: dict[str, list[dict]]):
-    if not visit_curves:
-        return []
 
-    # Créer une grille de fréquences commune (en GHz)
-    all_freqs = sorted(set(
-        round(p["freq_hz"] / 1e9, 6)
-        for curve in visit_curves.values()
-        for p in curve
-    ))
-    merged = []
+def merge_positions_for_chart(position_curves: dict[int, tuple]):
+    if not position_curves:
+        return None
 
-    # Interpoler les pertes pour chaque visite
-    for f in all_freqs:
-        point = {"freq": f}
-        for idx, (visit_str, curve) in enumerate(visit_curves.items(), start=1):
-            freqs = np.array([p["freq_hz"] / 1e9 for p in curve])
-            losses = np.array([p["avg_loss_db"] for p in curve])
-            # Interpolation linéaire
-            if len(freqs) > 1:
-                interp_loss = np.interp(f, freqs, losses)
-                point[f"visit{idx}"] = float(interp_loss)
-        merged.append(point)
+    first_freqs, _ = next(iter(position_curves.values()))
+    if not len(first_freqs):
+        return None
 
-    return merged
+    losses = _padded_losses(list(position_curves.values()), len(first_freqs))
+    series = {f"pos{pos}": losses[i] for i, pos in enumerate(position_curves)}
 
+    return first_freqs / 1e9, series  # en GHz
 
 
-def average_measurements(measure_arrays: list[list[dict]]):
-    if not measure_arrays:
-        return []
 
-    if len(measure_arrays) == 1:
-        single = measure_arrays[0]
-        return [{"freq_hz": p["freq_hz"], "avg_loss_db": p["loss_db"]} for p in single]
+VALID_EXTS = {".xls", ".xlsx", ".csv"}
 
-    base_freqs = [p["freq_hz"] for p in measure_arrays[0]]
-    combined = []
-    for i, freq in enumerate(base_freqs):
-        vals = []
-        for arr in measure_arrays:
-            if i < len(arr):
-                vals.append(arr[i]["loss_db"])
-        if vals:
-            avg_loss = float(np.mean(vals))
-            combined.append({"freq_hz": freq, "avg_loss_db": avg_loss})
-    return combined
 
+def read_position_files(position_dir: str, log_prefix: str = "[PLOT READ]") -> list[tuple]:
+    files = [f for f in get_storage().list_files(position_dir) if f.suffix.lower() in VALID_EXTS]
 
+    measure_arrays = []
+    for f in files:
+        data = read_measurement_file(f)
+        if data is not None:
+            measure_arrays.append(data)
+        else:
+            logging.warning(f"{log_prefix} Invalid data: {f.key}")
+    return measure_arrays
+
+
+def load_position_curves(db: Session, id_operation: int, position: int | None = None) -> dict[int, list[tuple]]:
+    query = (
+        db.query(Result.position, ResultCurve.freq_hz, ResultCurve.loss_db)
+        .outerjoin(ResultCurve, ResultCurve.result_id == Result.id)
+        .filter(Result.id_operation == id_operation)
+    )
+    if position is not None:
+        query = query.filter(Result.position == position)
+
+    rows = query.order_by(Result.position, Result.measurement_number).all()
+
+    curves, legacy = {}, set()
+    for pos, freq_blob, loss_blob in rows:
+        if freq_blob is None:
+            legacy.add(pos)
+            continue
+        curves.setdefault(pos, []).append((decode_curve(freq_blob), decode_curve(loss_blob)))
+
+    # Mesures importées avant le stockage des courbes : relire les fichiers archivés
+    for pos in legacy:
+        try:
+            curves[pos] = read_position_files(get_visit_path(db, id_operation, pos))
+        except HTTPException:
+            curves.pop(pos, None)
+
+    return {pos: arrays for pos, arrays in sorted(curves.items()) if arrays}
 
-def merge_positions_for_chart(position_curves: dict[int, list[dict]]):
-    if not position_curves:
-        return []
 
-    first_curve = next(iter(position_curves.values()))
-    if not first_curve:
+def get_position_averages(db: Session, id_operation: int, position: int | None = None) -> dict[int, tuple]:
+    rows = load_position_averages(db, id_operation, position)
+
+    query = db.query(Result.position, func.count(Result.id)).filter(Result.id_operation == id_operation)
+    if position is not None:
+        query = query.filter(Result.position == position)
+    result_counts = dict(query.group_by(Result.position).all())
+
+    # Positions jamais matérialisées (mesures antérieures, moyenne invalidée) ou dont la
+    # moyenne ne couvre pas toutes les mesures (upload concurrent d'une première lecture)
+    stale = {pos for pos, n in result_counts.items() if pos not in rows or rows[pos].n_measurements != n}
+    averages = {pos: average_curve(row) for pos, row in rows.items() if pos not in stale}
+
+    if stale:
+        for pos, measure_arrays in load_position_curves(db, id_operation, position).items():
+            if pos in stale:
+                # Nombre de results comparé ci-dessus, pour ne pas reconstruire à chaque lecture
+                row = store_position_average(db, id_operation, pos, measure_arrays, result_counts[pos])
+                db.flush()
+                averages[pos] = average_curve(row)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Même reconstruction faite en parallèle par une autre requête : la nôtre reste valable
+            db.rollback()
+
+    return dict(sorted(averages.items()))
+
+
+def load_patient_visits(db: Session, patient_id: str, position: int) -> list[dict]:
+    # Opérations du patient + moyenne matérialisée de la position : une seule requête
+    rows = (
+        db.query(Operation, PositionAverage)
+        .outerjoin(
+            PositionAverage,
+            and_(PositionAverage.id_operation == Operation.id_operation, PositionAverage.position == position),
+        )
+        .filter(Operation.patient_id == patient_id)
+        .order_by(Operation.operation_date.asc(), Operation.id_operation.asc())
+        .all()
+    )
+    if not rows:
         return []
+    if any(op.visit_str is None for op, _ in rows):
+        renumber_visits(db, patient_id)
+        db.commit()
 
-    base_freqs = [p["freq_hz"] for p in first_curve]
-    merged = []
+    result_counts = dict(
+        db.query(Result.id_operation, func.count(Result.id))
+        .filter(Result.id_operation.in_([op.id_operation for op, _ in rows]), Result.position == position)
+        .group_by(Result.id_operation)
+        .all()
+    )
 
-    for i, freq in enumerate(base_freqs):
-        point = {"freq": freq / 1e9}  # en GHz
-        for pos, curve in position_curves.items():
-            if i < len(curve):
-                point[f"pos{pos}"] = curve[i]["avg_loss_db"]
-        merged.append(point)
+    visits = []
+    for op, average in rows:
+        if average is not None and average.n_measurements == result_counts.get(op.id_operation):
+            curve = average_curve(average)
+        elif op.id_operation in result_counts:
+            curve = get_position_averages(db, op.id_operation, position).get(position)
+        else:
+            curve = None
 
-    return merged
+        visits.append({
+            "operation": op,
+            "visit_number": op.visit_number,
+            "visit_str": op.visit_str,
+            "curve": curve,
+        })
 
+    return visits
 
 
 def extract_time_from_filename(filename: str) -> int | None:
@@ -231,98 +277,88 @@ def extract_time_from_filename(filename: str) -> int | None:
     return hour * 3600 + minute * 60 + second
 
 
-def process_measurement_file(
+def result_file_key(result: Result, position_dir: str, position_files: list[str]) -> str | None:
+    # Nom enregistré à l'upload ; les lignes plus anciennes n'en ont pas et gardent
+    # l'ancienne règle (n-ième fichier de la position par ordre des noms)
+    if result.file_name:
+        return join_key(position_dir, result.file_name)
+    idx = (result.measurement_number or 0) - 1
+    return position_files[idx] if 0 <= idx < len(position_files) else None
+
+
+def uploaded_hashes(db: Session, id_operation: int) -> set[str]:
+    rows = db.query(Result.sha256).filter(Result.id_operation == id_operation, Result.sha256.isnot(None)).all()
+    return {digest for (digest,) in rows}
+
+
+def store_measurement_file(
     file: UploadFile,
+    analysis: dict,
     id_operation: int,
     position: int,
     db: Session,
-    visit_str: str,
     patient_id: str,
-    measurement_number=1
+    measurement_number=1,
+    sha256: str | None = None,
 ):
     try:
-        suffix = file.filename.split(".")[-1].lower()
-        df = None
-
-        try:
-            if suffix == "csv":
-                tmp = pd.read_csv(file.file, header=0, sep=None, engine="python")
-                cols = tmp.columns.astype(str).str.strip().str.lower().str.replace(r"\s+", "", regex=True)
-                if any("freq" in c for c in cols) and any("s11" in c or "returnloss" in c for c in cols):
-                    df = tmp.copy()
-                    df.columns = cols
-                else:
-                    file.file.seek(0)
-                    raw = pd.read_csv(file.file, header=None, sep=None, engine="python")
-                    df = infer_header_and_data(raw, key_cols=["freq", "returnloss"])
-            else:
-                tmp = pd.read_excel(file.file, header=0)
-                cols = tmp.columns.astype(str).str.strip().str.lower().str.replace(r"\s+", "", regex=True)
-                if any("freq" in c for c in cols) and any("s11" in c or "returnloss" in c for c in cols):
-                    df = tmp.copy()
-                    df.columns = cols
-                else:
-                    file.file.seek(0)
-                    raw = pd.read_excel(file.file, header=None)
-                    df = infer_header_and_data(raw, key_cols=["freq", "returnloss"])
-        except Exception as e:
-            logging.warning(f"Skipping {file.filename}: read error {e}")
-            return None
-
-        if df is None:
-            logging.warning(f"Skipping {file.filename}: could not infer header")
-            return None
-        
-        df.columns = df.columns.astype(str).str.strip().str.lower().str.replace(r"\s+", "", regex=True)
-        freq_cols = [c for c in df.columns if "freq" in c]
-        rl_cols = [c for c in df.columns if "s11" in c or "returnloss" in c]
-        if not freq_cols or not rl_cols:
-            logging.warning(f"Skipping {file.filename}: missing freq or return loss cols")
-            return None
-
-        freq_col, rl_col = freq_cols[0], rl_cols[0]
-        df_vals = df[[freq_col, rl_col]].astype(str).map(lambda x: x.replace(",", "."))
-        df_sub = df_vals.apply(pd.to_numeric, errors="coerce").dropna()
-        if df_sub.empty:
-            logging.warning(f"Skipping {file.filename}: no numeric data after coercion")
-            return None
-        
-        min_idx = df_sub[rl_col].idxmin()
-        min_freq = df_sub.at[min_idx, freq_col]
-        min_rl = df_sub.at[min_idx, rl_col]
-
-        mask = df_sub[rl_col] <= -3
-        bw = np.nan
-        if mask.any():
-            freqs = df_sub.loc[mask, freq_col]
-            bw = freqs.max() - freqs.min()
-
         file.file.seek(0)
-        archive_dir = DATA_ROOT / patient_id / visit_str / str(position)
-        archive_dir.mkdir(parents=True, exist_ok=True)
-        archive_path = archive_dir / file.filename
+        archive_dir = join_key(visit_folder(patient_id, id_operation), position)
+        archive_key = join_key(archive_dir, file.filename)
 
         try:
-            with open(archive_path, "wb") as out_f:
-                shutil.copyfileobj(file.file, out_f)
+            get_storage().save(archive_key, file.file)
         except Exception as e:
-            if archive_path.exists():
-                archive_path.unlink() 
             logging.error(f"[SAVE FILE] Failed to save {file.filename}: {e}")
             return None
+        finally:
+            curve_cache.invalidate_folder(archive_dir)
 
         result = Result(
             id_operation=int(id_operation),
             position=int(position),
             measurement_number=measurement_number,
-            min_return_loss_db=float(min_rl),
-            min_frequency_hz=int(min_freq),
-            bandwidth_hz=float(bw) if not pd.isna(bw) else None,
             uploaded_at=datetime.now(timezone.utc),
+            file_name=file.filename,
+            sha256=sha256,
+            **analysis["metrics"],
         )
+        result.curve = ResultCurve(**analysis["curve"])
         db.add(result)
+        add_to_position_average(
+            db,
+            int(id_operation),
+            int(position),
+            decode_curve(analysis["curve"]["freq_hz"]),
+            decode_curve(analysis["curve"]["loss_db"]),
+        )
         return result
 
+    except Exception as e:
+        logging.error(f"[STORE FILE] {file.filename}: {e}")
+        traceback.print_exc()
+        return None
+
+
+def process_measurement_file(
+    file: UploadFile,
+    id_operation: int,
+    position: int,
+    db: Session,
+    patient_id: str,
+    measurement_number=1,
+    sha256: str | None = None,
+):
+    try:
+        analysis = analyse_measurement(file.file.read(), file.filename)
+        if analysis is None:
+            logging.warning(f"Skipping {file.filename}: no usable sweep")
+            return None
+
+        return store_measurement_file(
+            file, analysis, id_operation, position, db, patient_id, measurement_number, sha256
+        )
+
     except Exception as e:
         logging.error(f"[PROCESS FILE] {file.filename}: {e}")
         traceback.print_exc()
@@ -331,8 +367,10 @@ def process_measurement_file(
 # ---------------------
 # CREATE RESULT
 # ---------------------
+# Handlers d'upload en "def" : FastAPI les exécute dans son threadpool, donc pandas,
+# les copies de fichiers et la session SQLAlchemy ne bloquent pas la boucle d'événements.
 @router.post("/process-results/{id_operation}/{position}")
-async def create_result(
+def create_result(
     id_operation: int,
     position: int,
     files: list[UploadFile] = File(...),
@@ -347,15 +385,6 @@ async def create_result(
             raise HTTPException(status_code=400, detail="No files provided")
 
         patient_id = operation.patient_id
-        all_ops = (
-            db.query(Operation)
-            .filter(Operation.patient_id == patient_id)
-            .order_by(Operation.operation_date.asc())
-            .all()
-        )
-
-        visit_number = {op.id_operation: idx + 1 for idx, op in enumerate(all_ops)}[id_operation]
-        visit_str = f"{visit_number}-{operation.name.replace(' ', '_')}_{operation.operation_date.strftime('%d%m%Y')}"
 
         existing = (
             db.query(Result)
@@ -365,16 +394,27 @@ async def create_result(
         )
         start_index = len(existing) + 1
 
+        # Fichiers déjà envoyés pour cette opération (renvoi après coupure Wi-Fi) : ni re-parsés ni ré-archivés
+        seen = uploaded_hashes(db, id_operation)
+        new_files, duplicates = [], []
+        for f in files:
+            digest = sha256_stream(f.file)
+            if digest in seen:
+                duplicates.append(f.filename)
+                continue
+            seen.add(digest)
+            new_files.append((f, digest))
+
         saved_results = []
-        for idx, f in enumerate(files, start=start_index):
+        for idx, (f, digest) in enumerate(new_files, start=start_index):
             res = process_measurement_file(
                 file=f,
                 id_operation=id_operation,
                 position=position,
                 db=db,
-                visit_str=visit_str,
                 patient_id=patient_id,
                 measurement_number=idx,
+                sha256=digest,
             )
             if res:
                 saved_results.append(res)
@@ -382,6 +422,13 @@ async def create_result(
         db.commit()
 
         if not saved_results:
+            if duplicates:
+                return {
+                    "status": "success",
+                    "message": f"All {len(duplicates)} file(s) were already uploaded",
+                    "results": [],
+                    "skipped_duplicates": duplicates,
+                }
             return {"status": "error", "message": "No valid files were processed"}
 
         payload = [
@@ -402,6 +449,7 @@ async def create_result(
             "status": "success",
             "message": f"Processed {len(saved_results)} file(s)",
             "results": payload,
+            "skipped_duplicates": duplicates,
         }
 
     except HTTPException:
@@ -416,7 +464,7 @@ async def create_result(
 # CREATE ALL RESULT
 # ---------------------
 @router.post("/process-all/{id_operation}")
-async def create_all_results(
+def create_all_results(
     id_operation: int,
     files: list[UploadFile] = File(...),
     db: Session = Depends(get_db),
@@ -428,17 +476,6 @@ async def create_all_results(
 
         patient_id = operation.patient_id
 
-        all_ops = (
-            db.query(Operation)
-            .filter(Operation.patient_id == patient_id)
-            .order_by(Operation.operation_date.asc())
-            .all()
-        )
-
-        visit_number = {op.id_operation: idx + 1 for idx, op in enumerate(all_ops)}[operation.id_operation]
-        visit_name = operation.name.replace(" ", "_")
-        visit_str = f"{visit_number}-{visit_name}_{operation.operation_date.strftime('%d%m%Y')}"
-
         timed_files = []
         for f in files:
             t = extract_time_from_filename(f.filename)
@@ -455,36 +492,70 @@ async def create_all_results(
 
         grouped = {pos: sorted_files[(pos - 1) * 3: pos * 3] for pos in range(1, 7)}
 
+        # Décodage + métriques en parallèle, archivage et insertions ensuite dans l'ordre
+        ordered = [(pos, idx, f) for pos, pos_files in grouped.items() for idx, f in enumerate(pos_files, start=1)]
+        contents = [f.file.read() for _, _, f in ordered]
+        digests = [hashlib.sha256(content).hexdigest() for content in contents]
+
+        # Renvoi des mêmes fichiers : on les écarte avant le parsing, les numéros de mesure restent ceux du lot
+        seen = uploaded_hashes(db, id_operation)
+        duplicates, keep = [], []
+        for i, digest in enumerate(digests):
+            if digest in seen:
+                duplicates.append(ordered[i][2].filename)
+            else:
+                seen.add(digest)
+                keep.append(i)
+        ordered = [ordered[i] for i in keep]
+        contents = [contents[i] for i in keep]
+        digests = [digests[i] for i in keep]
+
+        analyses = list(get_parse_pool().map(
+            analyse_measurement, contents, [f.filename for _, _, f in ordered]
+        ))
+
         all_results = []
         counter_db = 0
         batch_size_db = 5
 
-        for pos, pos_files in grouped.items():
-            for idx, f in enumerate(pos_files, start=1):
-                result = process_measurement_file(
-                    f,
-                    id_operation,
-                    pos,
-                    db,
-                    visit_str,
-                    patient_id,
-                    measurement_number=idx,
-                )
-                if result:
-                    all_results.append(result)
-                    counter_db += 1
-                    if counter_db % batch_size_db == 0:
-                        db.commit()
+        for (pos, idx, f), analysis, digest in zip(ordered, analyses, digests):
+            if analysis is None:
+                logging.warning(f"Skipping {f.filename}: no usable sweep")
+                continue
+
+            result = store_measurement_file(
+                f,
+                analysis,
+                id_operation,
+                pos,
+                db,
+                patient_id,
+                measurement_number=idx,
+                sha256=digest,
+            )
+            if result:
+                all_results.append(result)
+                counter_db += 1
+                if counter_db % batch_size_db == 0:
+                    db.commit()
 
         db.commit()
 
         if not all_results:
+            if duplicates:
+                return {
+                    "status": "success",
+                    "message": f"All {len(duplicates)} file(s) were already uploaded",
+                    "results": [],
+                    "skipped_duplicates": duplicates,
+                }
             return {"status": "error", "message": "No valid files were processed"}
 
         return {
             "status": "success",
             "message": f"Processed {len(all_results)} files across 6 positions",
             "results": all_results,
+            "skipped_duplicates": duplicates,
         }
 
     except Exception as e:
@@ -498,8 +569,30 @@ async def create_all_results(
 # ---------------------
 
 @router.get("/")
-def get_results(db: Session = Depends(get_db)):
-    return db.query(Result).all()
+def get_results(
+    response: Response,
+    limit: int | None = Query(None),
+    after: int | None = Query(None),
+    patient_id: str | None = Query(None),
+    id_operation: int | None = Query(None),
+    position: int | None = Query(None),
+    date_from: date | None = Query(None),
+    date_to: date | None = Query(None),
+    fields: str | None = Query(None),
+    db: Session = Depends(get_db),
+):
+    query = query_fields(db, Result, fields)
+    if id_operation is not None:
+        query = query.filter(Result.id_operation == id_operation)
+    if position is not None:
+        query = query.filter(Result.position == position)
+    # Patient et période portent sur l'opération (date de la visite)
+    if patient_id is not None or date_from is not None or date_to is not None:
+        query = query.join(Operation, Operation.id_operation == Result.id_operation)
+        if patient_id is not None:
+            query = query.filter(Operation.patient_id == patient_id)
+        query = filter_date_range(query, Operation.operation_date, date_from, date_to)
+    return as_fields(keyset_page(query, Result.id, response, limit, after), fields)
 
 
 # ---------------------
@@ -507,14 +600,14 @@ def get_results(db: Session = Depends(get_db)):
 # ---------------------
 
 @router.get("/by_operation/{id_operation}")
-def get_results(id_operation: int, db: Session = Depends(get_db)):
+def get_results(id_operation: int, fields: str | None = Query(None), db: Session = Depends(get_db)):
     results = (
-        db.query(Result)
+        query_fields(db, Result, fields)
         .filter(Result.id_operation == id_operation)
         .order_by(Result.position, Result.measurement_number)
         .all()
     )
-    return results
+    return as_fields(results, fields)
 
 
 # ------------------------
@@ -522,14 +615,14 @@ def get_results(id_operation: int, db: Session = Depends(get_db)):
 # ------------------------
 
 @router.get("/by_patient/{patient_id}")
-def get_results_by_patient(patient_id: str, db: Session = Depends(get_db)):
+def get_results_by_patient(patient_id: str, fields: str | None = Query(None), db: Session = Depends(get_db)):
     results = (
-        db.query(Result)
+        query_fields(db, Result, fields)
         .join(Operation, Result.id_operation == Operation.id_operation)
         .filter(Operation.patient_id == patient_id)
         .all()
     )
-    return results
+    return as_fields(results, fields)
 
 
 # -----------------------------------
@@ -545,11 +638,12 @@ def get_results_by_visit_and_position(id_operation: int, position: int, db: Sess
     )
 
     visit_dir = get_visit_path(db, id_operation, position)
-    file_list = sorted([f.name for f in visit_dir.glob("*") if f.is_file()])
+    file_list = [f.key for f in get_storage().list_files(visit_dir)]
 
     payload = []
-    for idx, r in enumerate(results):
-        file_name = file_list[idx] if idx < len(file_list) else None
+    for r in results:
+        file_key = result_file_key(r, visit_dir, file_list)
+        file_name = file_key.rsplit("/", 1)[-1] if file_key else None
         payload.append({
             "id": r.id,
             "measurement_number": r.measurement_number,
@@ -575,19 +669,6 @@ def delete_measurements(payload: dict, db: Session = Depends(get_db)):
         if not all([id_operation, position, measurement_number]):
             return {"status": "error", "message": "Missing required parameters (id_operation, position, measurement_number)"}
 
-        position_dir = get_visit_path(db, id_operation, position)
-        files = sorted([f for f in position_dir.glob("*") if f.is_file()])
-
-        if measurement_number > len(files):
-            return {"status": "error", "message": f"No file found for measurement_number {measurement_number}"}
-
-        file_to_delete = files[measurement_number - 1]
-
-        try:
-            file_to_delete.unlink()
-        except Exception as e:
-            return {"status": "error", "message": f"Failed to delete file: {e}"}
-
         result = (
             db.query(Result)
             .filter(
@@ -600,6 +681,22 @@ def delete_measurements(payload: dict, db: Session = Depends(get_db)):
         if not result:
             return {"status": "error", "message": f"No DB record found for measurement {measurement_number}"}
 
+        position_dir = get_visit_path(db, id_operation, position)
+        files = [f.key for f in get_storage().list_files(position_dir)]
+        file_to_delete = result_file_key(result, position_dir, files)
+
+        if file_to_delete is None:
+            return {"status": "error", "message": f"No file found for measurement_number {measurement_number}"}
+
+        try:
+            get_storage().delete(file_to_delete)
+        except Exception as e:
+            return {"status": "error", "message": f"Failed to delete file: {e}"}
+        finally:
+            curve_cache.invalidate_file(file_to_delete)
+            curve_cache.invalidate_folder(position_dir)
+
+        discard_from_position_average(db, result)
         db.delete(result)
         db.commit()
 
@@ -617,7 +714,7 @@ def delete_measurements(payload: dict, db: Session = Depends(get_db)):
 
         return {
             "status": "success",
-            "deleted_file": str(file_to_delete),
+            "deleted_file": file_to_delete,
             "reindexed": [r.id for r in results_to_update],
         }
 
@@ -630,58 +727,38 @@ def delete_measurements(payload: dict, db: Session = Depends(get_db)):
 # PLOT DATA BY VISIT
 # ---------------------
 @router.get("/plot-data-by-visit/{id_operation}")
-def get_plot_data_by_visit(id_operation: int, db: Session = Depends(get_db)):
+def get_plot_data_by_visit(
+    id_operation: int,
+    format: Literal["rows", "columnar"] = "rows",
+    max_points: int | None = Query(default=None, ge=10),
+    db: Session = Depends(get_db),
+):
     try:
         operation = db.query(Operation).filter(Operation.id_operation == id_operation).first()
         if not operation:
             raise HTTPException(status_code=404, detail=f"Operation {id_operation} not found")
 
-        results_all = db.query(Result).filter(Result.id_operation == id_operation).all()
-        if not results_all:
+        averages = get_position_averages(db, id_operation)
+        if not averages and not db.query(Result.id).filter(Result.id_operation == id_operation).first():
             return {
                 "status": "success",
                 "operation_id": id_operation,
                 "visit": None,
                 "n_positions": 0,
-                "graph_data": [],
+                "graph_data": render_chart(None, format),
             }
 
-        position_curves = {}
-
-        for pos in range(1, 7):
-            pos_results = [r for r in results_all if r.position == pos]
-            if not pos_results:
-                continue
-
-            position_dir = get_visit_path(db, id_operation, pos)
-            
-            valid_exts = {".xls", ".xlsx", ".csv"}
-            files = sorted([f for f in position_dir.glob("*") if f.is_file() and f.suffix.lower() in valid_exts])
-
-            measure_arrays = []
-            for f in files:
-                data = read_measurement_file(f)
-                if data:
-                    measure_arrays.append(data)
-                else:
-                    logging.warning(f"[PLOT VISIT] Invalid data: {f}")
-
-            if not measure_arrays:
-                continue
-
-            avg_curve = average_measurements(measure_arrays)
-            position_curves[pos] = avg_curve
+        position_curves = {pos: curve for pos, curve in averages.items() if pos in range(1, 7)}
 
         if not position_curves:
             raise HTTPException(status_code=400, detail="No valid data found for this visit")
 
-        graph_data = merge_positions_for_chart(position_curves)
-        visit_dir = get_visit_path(db, id_operation)
+        graph_data = render_chart(downsample_frame(merge_positions_for_chart(position_curves), max_points), format)
 
         return {
             "status": "success",
             "operation_id": id_operation,
-            "visit": visit_dir.name,
+            "visit": ensure_visit_str(db, operation),
             "n_positions": len(position_curves),
             "graph_data": graph_data,
         }
@@ -697,37 +774,21 @@ def get_plot_data_by_visit(id_operation: int, db: Session = Depends(get_db)):
 # PLOT DATA BY POSITION
 # ---------------------
 @router.get("/plot-data-by-position/{id_operation}/{position}")
-def get_plot_data_by_position(id_operation: int, position: int, db: Session = Depends(get_db)):
+def get_plot_data_by_position(
+    id_operation: int,
+    position: int,
+    format: Literal["rows", "columnar"] = "rows",
+    max_points: int | None = Query(default=None, ge=10),
+    db: Session = Depends(get_db),
+):
     try:
-        results = (
-            db.query(Result)
-            .filter(Result.id_operation == id_operation, Result.position == position)
-            .order_by(Result.measurement_number.asc())
-            .all()
-        )
-        if not results:
-            raise HTTPException(status_code=404, detail="No measurements found for this position")
-
-        position_dir = get_visit_path(db, id_operation, position)
-        
-        valid_exts = {".xls", ".xlsx", ".csv"}
-        files = sorted([
-            f for f in position_dir.glob("*")
-            if f.is_file() and f.suffix.lower() in valid_exts
-        ])
-
-        measure_arrays = []
-        for f in files:
-            data = read_measurement_file(f)
-            if data:
-                measure_arrays.append(data)
-            else:
-                logging.warning(f"[PLOT DATA] Invalid data: {f}")
-
-        if not measure_arrays:
+        measure_arrays = load_position_curves(db, id_operation, position).get(position)
+        if measure_arrays is None:
+            if not db.query(Result.id).filter(Result.id_operation == id_operation, Result.position == position).first():
+                raise HTTPException(status_code=404, detail="No measurements found for this position")
             raise HTTPException(status_code=400, detail="No valid measurement data found locally")
 
-        graph_data = merge_measurements_for_chart(measure_arrays)
+        graph_data = render_chart(downsample_frame(merge_measurements_for_chart(measure_arrays), max_points), format)
 
         return {
             "status": "success",
@@ -748,68 +809,23 @@ def get_plot_data_by_position(id_operation: int, position: int, db: Session = De
 # PLOT DATA BY PATIENT (EVOLUTION OF A POSITION)
 # ---------------------
 @router.get("/plot-data-by-patient/{patient_id}/{position}")
-def get_plot_data_by_patient(patient_id: str, position: int, db: Session = Depends(get_db)):
+def get_plot_data_by_patient(
+    patient_id: str,
+    position: int,
+    format: Literal["rows", "columnar"] = "rows",
+    max_points: int | None = Query(default=None, ge=10),
+    db: Session = Depends(get_db),
+):
     try:
-        all_ops = (
-            db.query(Operation)
-            .filter(Operation.patient_id == patient_id)
-            .order_by(Operation.operation_date.asc())
-            .all()
-        )
-
-        if not all_ops:
+        visits = load_patient_visits(db, patient_id, position)
+        if not visits:
             raise HTTPException(status_code=404, detail=f"No operations found for patient {patient_id}")
 
-        visit_curves = {}
-        visit_labels = []
-
-        for op in all_ops:
-            visit_name = op.name.strip()
-            visit_number = {o.id_operation: idx + 1 for idx, o in enumerate(all_ops)}[op.id_operation]
-            visit_str = f"{visit_number}-{visit_name.replace(' ', '_')}_{op.operation_date.strftime('%d%m%Y')}"
-
-            try:
-                visit_dir = get_visit_path(db, op.id_operation, position)
-            except HTTPException:
-                continue
-
-            results = (
-                db.query(Result)
-                .filter(Result.id_operation == op.id_operation, Result.position == position)
-                .order_by(Result.measurement_number.asc())
-                .all()
-            )
-            if not results:
-                continue
-
-            valid_exts = {".xls", ".xlsx", ".csv"}
-            files = sorted([
-                f for f in visit_dir.glob("*")
-                if f.is_file() and f.suffix.lower() in valid_exts
-            ])
-            
-            measure_arrays = [read_measurement_file(f) for f in files if f.is_file()]
-            measure_arrays = [m for m in measure_arrays if m]
-
-            if not measure_arrays:
-                continue
-
-            avg_curve = average_measurements(measure_arrays)
-            if avg_curve:
-                visit_curves[visit_number] = {
-                    "name": visit_name,
-                    "curve": avg_curve
-                }
-                visit_labels.append(visit_name)
-
-        visit_curves = dict(sorted(visit_curves.items(), key=lambda x: x[0]))
-
-        merged = {}
-        for idx, (num, v) in enumerate(visit_curves.items(), start=1):
-            merged[f"visit{idx}"] = v["curve"]
+        visit_curves = [v for v in visits if v["curve"] is not None]
+        merged = {f"visit{idx}": v["curve"] for idx, v in enumerate(visit_curves, start=1)}
 
-        graph_data = merge_visits_for_chart(merged)
-        visit_names = {f"visit{idx}": v["name"] for idx, v in enumerate(visit_curves.values(), start=1)}
+        graph_data = render_chart(downsample_frame(merge_visits_for_chart(merged), max_points), format)
+        visit_names = {f"visit{idx}": v["operation"].name.strip() for idx, v in enumerate(visit_curves, start=1)}
 
         return {
             "status": "success",
@@ -2,7 +2,8 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from app.db.database import get_db
 from app.db.models import User
-from fastapi import APIRouter, Depends, HTTPException, Body
+from app.core.pagination import keyset_page
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Response
 from supabase import create_client
 from datetime import datetime, timezone
 
@@ -113,8 +114,23 @@ def get_user(user_id: str, db: Session = Depends(get_db)):
 # READ ALL USERS
 # ---------------------
 @router.get("/")
-def get_users(db: Session = Depends(get_db)):
-    users = db.query(User).all()
+def get_users(
+    response: Response,
+    limit: int | None = Query(None),
+    after: str | None = Query(None),
+    role: str | None = Query(None),
+    user_type: str | None = Query(None),
+    institution: str | None = Query(None),
+    db: Session = Depends(get_db),
+):
+    query = db.query(User)
+    if role is not None:
+        query = query.filter(User.role == role)
+    if user_type is not None:
+        query = query.filter(User.user_type == user_type)
+    if institution is not None:
+        query = query.filter(User.institution == institution)
+    users = keyset_page(query, User.id, response, limit, after)
     return [
         {
             "id": str(u.id),
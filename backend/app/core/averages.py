@@ -0,0 +1,125 @@
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.measurements import encode_curve, decode_curve
+from app.db.models import PositionAverage, Result
+
+# ---------------------
+# Materialized position averages
+# ---------------------
+# A PositionAverage row keeps, for each frequency index, the sum of the losses and
+# the number of sweeps contributing to it. Uploads add to the sums and deletes
+# subtract from them, so a visit plot only has to divide two arrays.
+
+
+def _unpack(row: PositionAverage):
+    return (
+        decode_curve(row.freq_hz, "<f8"),
+        decode_curve(row.loss_sum, "<f8"),
+        decode_curve(row.point_count, "<i4"),
+    )
+
+
+def _pack(row: PositionAverage, freqs, sums, counts):
+    row.freq_hz = encode_curve(freqs, "<f8")
+    row.loss_sum = encode_curve(sums, "<f8")
+    row.point_count = encode_curve(counts, "<i4")
+    row.updated_at = datetime.now(timezone.utc)
+
+
+def average_curve(row: PositionAverage):
+    freqs, sums, counts = _unpack(row)
+    return freqs, sums / counts
+
+
+def store_position_average(
+    db: Session, id_operation: int, position: int, measure_arrays: list[tuple], n_measurements: int | None = None
+):
+    length = max(len(freqs) for freqs, _ in measure_arrays)
+    freqs = np.zeros(length)
+    sums = np.zeros(length)
+    counts = np.zeros(length, dtype=np.int64)
+
+    # Grille de fréquences : celle de la première mesure, complétée par les plus longues
+    for f, _ in reversed(measure_arrays):
+        freqs[:len(f)] = f
+    for _, loss in measure_arrays:
+        sums[:len(loss)] += loss
+        counts[:len(loss)] += 1
+
+    row = db.get(PositionAverage, (id_operation, position))
+    if row is None:
+        row = PositionAverage(id_operation=id_operation, position=position)
+        db.add(row)
+    # n_measurements : nombre de results couverts, comparé à la lecture. Il peut dépasser
+    # le nombre de courbes quand des fichiers anciens sont absents ou illisibles.
+    row.n_measurements = len(measure_arrays) if n_measurements is None else n_measurements
+    _pack(row, freqs, sums, counts)
+    return row
+
+
+def add_to_position_average(db: Session, id_operation: int, position: int, freqs, losses):
+    row = (
+        db.query(PositionAverage)
+        .filter(PositionAverage.id_operation == id_operation, PositionAverage.position == position)
+        .with_for_update()
+        .first()
+    )
+    # Pas encore matérialisée : elle sera construite depuis toutes les courbes à la prochaine
+    # lecture. Si une lecture concurrente a déjà pris son instantané sans cette mesure,
+    # n_measurements ne correspondra pas au nombre de results et la lecture suivante reconstruit.
+    if row is None:
+        return None
+
+    grid, sums, counts = _unpack(row)
+    n = len(losses)
+    if n > len(grid):
+        grid = np.concatenate([grid, freqs[len(grid):]])
+        sums = np.pad(sums, (0, n - len(sums)))
+        counts = np.pad(counts, (0, n - len(counts)))
+
+    sums[:n] += losses
+    counts[:n] += 1
+    row.n_measurements += 1
+    _pack(row, grid, sums, counts)
+    return row
+
+
+def discard_from_position_average(db: Session, result: Result):
+    row = (
+        db.query(PositionAverage)
+        .filter(PositionAverage.id_operation == result.id_operation, PositionAverage.position == result.position)
+        .with_for_update()
+        .first()
+    )
+    if row is None:
+        return
+
+    # Mesure sans courbe stockée (import ancien) : on ne sait pas quoi soustraire,
+    # la moyenne sera reconstruite à la prochaine lecture
+    if result.curve is None or row.n_measurements <= 1:
+        db.delete(row)
+        return
+
+    grid, sums, counts = _unpack(row)
+    losses = decode_curve(result.curve.loss_db)
+    n = min(len(losses), len(sums))
+    sums[:n] -= losses[:n]
+    counts[:n] -= 1
+
+    keep = int(np.flatnonzero(counts).max()) + 1 if counts.any() else 0
+    if keep == 0:
+        db.delete(row)
+        return
+
+    row.n_measurements -= 1
+    _pack(row, grid[:keep], sums[:keep], counts[:keep])
+
+
+def load_position_averages(db: Session, id_operation: int, position: int | None = None) -> dict[int, PositionAverage]:
+    query = db.query(PositionAverage).filter(PositionAverage.id_operation == id_operation)
+    if position is not None:
+        query = query.filter(PositionAverage.position == position)
+    return {row.position: row for row in query.order_by(PositionAverage.position).all()}
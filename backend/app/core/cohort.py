@@ -0,0 +1,143 @@
+import logging
+from typing import Callable, Iterator
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.core.exports import StreamBuffer
+from app.core.measurements import decode_curve
+from app.db.database import SessionLocal
+from app.db.models import Operation, Result, ResultCurve, SickPatient
+
+COHORT_FORMATS = ("parquet", "arrow")
+
+# ---------------------
+# Cohort analytics export
+# ---------------------
+# Une ligne par Result : données patient, opération, métriques et balayage complet
+# (listes float64 fréquence / return loss, telles que stockées dans result_curves).
+# Un lot par patient, dans l'ordre des patient_id : en Parquet chaque patient forme
+# son propre row group, dont les statistiques permettent le filtrage à la lecture.
+# Les mesures importées avant le stockage des courbes ont un balayage nul
+# (python -m app.jobs.reprocess_results pour les compléter).
+
+COHORT_SCHEMA = pa.schema([
+    ("patient_id", pa.string()),
+    ("age", pa.int32()),
+    ("gender", pa.int32()),
+    ("lymphedema_side", pa.int32()),
+    ("bmi", pa.float64()),
+    ("id_operation", pa.int64()),
+    ("operation_name", pa.string()),
+    ("operation_date", pa.timestamp("us")),
+    ("visit_number", pa.int32()),
+    ("result_id", pa.int64()),
+    ("position", pa.int32()),
+    ("measurement_number", pa.int32()),
+    ("min_return_loss_db", pa.float64()),
+    ("min_frequency_hz", pa.float64()),
+    ("bandwidth_hz", pa.float64()),
+    ("uploaded_at", pa.timestamp("us")),
+    ("n_points", pa.int32()),
+    ("frequency_hz", pa.list_(pa.float64())),
+    ("return_loss_db", pa.list_(pa.float64())),
+])
+
+
+def _sweep(blob):
+    return None if blob is None else decode_curve(blob)
+
+
+def patient_batch(db, patient: SickPatient) -> pa.RecordBatch | None:
+    rows = (
+        db.query(
+            Operation.id_operation,
+            Operation.name,
+            Operation.operation_date,
+            Operation.visit_number,
+            Result.id,
+            Result.position,
+            Result.measurement_number,
+            Result.min_return_loss_db,
+            Result.min_frequency_hz,
+            Result.bandwidth_hz,
+            Result.uploaded_at,
+            ResultCurve.n_points,
+            ResultCurve.freq_hz,
+            ResultCurve.loss_db,
+        )
+        .join(Result, Result.id_operation == Operation.id_operation)
+        .outerjoin(ResultCurve, ResultCurve.result_id == Result.id)
+        .filter(Operation.patient_id == patient.patient_id)
+        .order_by(Operation.operation_date, Operation.id_operation, Result.position, Result.measurement_number)
+        .all()
+    )
+    if not rows:
+        return None
+
+    n = len(rows)
+    columns = list(zip(*rows))
+    data = {
+        "patient_id": [patient.patient_id] * n,
+        "age": [patient.age] * n,
+        "gender": [patient.gender] * n,
+        "lymphedema_side": [patient.lymphedema_side] * n,
+        "bmi": [patient.bmi] * n,
+        "id_operation": columns[0],
+        "operation_name": columns[1],
+        "operation_date": columns[2],
+        "visit_number": columns[3],
+        "result_id": columns[4],
+        "position": columns[5],
+        "measurement_number": columns[6],
+        "min_return_loss_db": columns[7],
+        "min_frequency_hz": columns[8],
+        "bandwidth_hz": columns[9],
+        "uploaded_at": columns[10],
+        "n_points": columns[11],
+        "frequency_hz": [_sweep(blob) for blob in columns[12]],
+        "return_loss_db": [_sweep(blob) for blob in columns[13]],
+    }
+    return pa.RecordBatch.from_arrays(
+        [pa.array(data[field.name], type=field.type) for field in COHORT_SCHEMA],
+        schema=COHORT_SCHEMA,
+    )
+
+
+def cohort_batches(db, patient_ids: list[str] | None = None) -> Iterator[pa.RecordBatch]:
+    query = db.query(SickPatient).order_by(SickPatient.patient_id)
+    if patient_ids:
+        query = query.filter(SickPatient.patient_id.in_(patient_ids))
+
+    for patient in query.all():
+        batch = patient_batch(db, patient)
+        if batch is not None:
+            yield batch
+
+
+def open_writer(sink, fmt: str):
+    if fmt == "arrow":
+        return pa.ipc.new_stream(sink, COHORT_SCHEMA)
+    return pq.ParquetWriter(sink, COHORT_SCHEMA, compression="zstd")
+
+
+def iter_cohort(
+    patient_ids: list[str] | None = None,
+    fmt: str = "parquet",
+    session_factory: Callable = SessionLocal,
+) -> Iterator[bytes]:
+    # Session propre au générateur : la réponse est envoyée après la fin de l'endpoint
+    db = session_factory()
+    out = StreamBuffer()
+    try:
+        writer = open_writer(out, fmt)
+        n_rows = 0
+        for batch in cohort_batches(db, patient_ids):
+            writer.write_batch(batch)
+            n_rows += batch.num_rows
+            yield out.take()
+        writer.close()
+        yield out.take()
+        logging.info(f"[COHORT] Exported {n_rows} result(s) as {fmt}")
+    finally:
+        db.close()
@@ -16,6 +16,26 @@ class Settings(BaseSettings):
     SUPABASE_URL: str
     SUPABASE_SERVICE_ROLE_KEY: str
 
+    # Pool used to parse uploaded VNA files ("process" or "thread")
+    PARSE_POOL_KIND: str = "process"
+    PARSE_POOL_WORKERS: int = 4
+
+    # Background thumbnail generation for uploaded photos
+    THUMBNAIL_POOL_WORKERS: int = 2
+
+    # Parallel compression of zip exports
+    EXPORT_POOL_WORKERS: int = 4
+
+    # Archive storage ("local" under DATA_ROOT, or "s3" for an S3-compatible bucket)
+    STORAGE_BACKEND: str = "local"
+    DATA_ROOT: str = r"C:\Users\Pimprenelle\Documents\LymphTrackData"
+    CURVE_CACHE_DIR: str | None = None
+    EXPORT_CACHE_DIR: str | None = None
+    S3_BUCKET: str | None = None
+    S3_PREFIX: str = ""
+    S3_ENDPOINT_URL: str | None = None
+    S3_REGION: str | None = None
+
     class Config:
         env_file = "backend/.env" 
 
@@ -0,0 +1,73 @@
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.storage import StoredFile, get_storage
+
+CACHE_DIR = Path(settings.CURVE_CACHE_DIR or Path(settings.DATA_ROOT) / ".curve_cache")
+
+# ---------------------
+# Parsed curve cache
+# ---------------------
+# One .npz per raw VNA file (indexed by its storage key), holding the parsed
+# (freq, loss) arrays together with the size and mtime of the stored file. An
+# entry is only served while both still match, so a file replaced in storage is
+# re-parsed even if nobody invalidated it. The cache itself is always on local disk.
+
+
+def _entry_path(key: str) -> Path:
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return CACHE_DIR / digest[:2] / f"{digest}.npz"
+
+
+def load_curve(stored: StoredFile):
+    entry = _entry_path(stored.key)
+    if not entry.exists():
+        return None
+
+    try:
+        with np.load(entry, allow_pickle=False) as data:
+            if int(data["size"]) != stored.size or int(data["mtime_ns"]) != stored.mtime_ns:
+                return None
+            return data["freq"], data["loss"]
+    except Exception as e:
+        logging.warning(f"[CURVE CACHE] Dropping unreadable entry for {stored.key}: {e}")
+        entry.unlink(missing_ok=True)
+        return None
+
+
+def store_curve(stored: StoredFile, freq, loss):
+    try:
+        entry = _entry_path(stored.key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+
+        fd, tmp_name = tempfile.mkstemp(dir=entry.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_f:
+                np.savez(
+                    tmp_f,
+                    freq=np.asarray(freq, dtype=np.float64),
+                    loss=np.asarray(loss, dtype=np.float64),
+                    size=np.int64(stored.size),
+                    mtime_ns=np.int64(stored.mtime_ns),
+                )
+            os.replace(tmp_name, entry)
+        except Exception:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+    except Exception as e:
+        logging.warning(f"[CURVE CACHE] Could not cache {stored.key}: {e}")
+
+
+def invalidate_file(key: str):
+    _entry_path(key).unlink(missing_ok=True)
+
+
+def invalidate_folder(prefix: str):
+    for stored in get_storage().list_files(prefix):
+        invalidate_file(stored.key)
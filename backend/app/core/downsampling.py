@@ -0,0 +1,74 @@
+import numpy as np
+
+# ---------------------
+# Curve downsampling
+# ---------------------
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Largest-Triangle-Three-Buckets : premier et dernier points gardés,
+    # un point par bucket, celui qui forme le plus grand triangle avec le
+    # point retenu précédemment et la moyenne du bucket suivant.
+    edges = (np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.int64) + 1
+    edges = np.append(edges, n - 1)
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        if next_end <= next_start:
+            next_end = next_start + 1
+
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    selected[-1] = n - 1
+    return selected
+
+
+def downsample_frame(frame, max_points: int | None):
+    if frame is None or max_points is None:
+        return frame
+
+    freqs, series = frame
+    if len(freqs) <= max_points or not series:
+        return frame
+
+    stack = np.vstack(list(series.values()))
+    valid = ~np.isnan(stack)
+
+    # Le minimum de résonance de chaque série est toujours conservé
+    minima = {
+        int(np.nanargmin(values))
+        for values, has_data in zip(stack, valid.any(axis=1))
+        if has_data
+    }
+
+    # Enveloppe basse de toutes les séries : c'est elle qui porte les creux à préserver
+    envelope = np.where(valid, stack, np.inf).min(axis=0)
+    envelope[np.isinf(envelope)] = 0.0
+
+    # max_points borne le total : minima d'abord (les plus profonds si trop nombreux),
+    # LTTB sur le reste, sauf s'il reste moins que ses 3 points minimum
+    minima = np.array(sorted(minima, key=lambda idx: envelope[idx])[:max_points], dtype=np.int64)
+    budget = max_points - len(minima)
+    if budget >= 3:
+        keep = np.union1d(lttb_indices(freqs, envelope, budget), minima)
+    else:
+        keep = np.sort(minima)
+
+    return freqs[keep], {key: values[keep] for key, values in series.items()}
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Callable
+
+from fastapi.responses import FileResponse
+
+from app.core.config import settings
+from app.core.exports import iter_zip, write_raw_entry
+from app.core.storage import CHUNK_SIZE, StoredFile
+
+CACHE_DIR = Path(settings.EXPORT_CACHE_DIR or Path(settings.DATA_ROOT) / ".export_cache")
+
+# ---------------------
+# Cached export archives
+# ---------------------
+# Un zip par visite et un par patient, rangés sous CACHE_DIR/<patient_id>/ et
+# nommés d'après l'empreinte de leur manifeste (clé, nom dans l'archive, taille,
+# mtime de chaque fichier) : une archive dont un fichier a changé n'est plus
+# trouvée et se reconstruit d'elle-même. L'archive patient recopie telles quelles
+# les entrées compressées des zips de visite, seules les visites modifiées sont
+# donc recompressées. Comme le cache de courbes, il reste toujours sur le disque local.
+
+Entries = list[tuple[StoredFile, str]]
+
+
+def manifest_digest(entries: Entries) -> str:
+    manifest = [[f.key, arcname, f.size, f.mtime_ns] for f, arcname in entries]
+    return hashlib.sha256(json.dumps(manifest).encode("utf-8")).hexdigest()[:24]
+
+
+def _build(path: Path, write: Callable[[object], None], stem: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp_f:
+            write(tmp_f)
+        os.replace(tmp_name, path)
+    except Exception:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+    # Les versions précédentes ne seront plus jamais servies ; une copie encore en
+    # cours d'envoi (Windows) sera supprimée à la prochaine reconstruction.
+    for old in path.parent.glob(f"{stem}-*.zip"):
+        if old != path:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+
+def visit_archive(patient_id: str, visit_id: str, entries: Entries) -> Path:
+    path = CACHE_DIR / patient_id / f"{visit_id}-{manifest_digest(entries)}.zip"
+    if not path.exists():
+        logging.info(f"[EXPORT CACHE] Building {patient_id}/{visit_id} ({len(entries)} file(s))")
+
+        def write(out):
+            for chunk in iter_zip(entries):
+                out.write(chunk)
+
+        _build(path, write, visit_id)
+    return path
+
+
+def _copy_entries(zipf: zipfile.ZipFile, out, archive: Path):
+    with zipfile.ZipFile(archive) as src, open(archive, "rb") as fp:
+        for info in src.infolist():
+            fp.seek(info.header_offset)
+            header = fp.read(zipfile.sizeFileHeader)
+            name_len, extra_len = struct.unpack("<HH", header[26:30])
+            fp.seek(name_len + extra_len, os.SEEK_CUR)
+
+            copied = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+            copied.compress_type = info.compress_type
+            copied.CRC = info.CRC
+            copied.file_size = info.file_size
+            copied.compress_size = info.compress_size
+
+            def chunks(remaining=info.compress_size):
+                while remaining > 0:
+                    chunk = fp.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise zipfile.BadZipFile(f"Truncated entry {info.filename} in {archive}")
+                    remaining -= len(chunk)
+                    yield chunk
+
+            write_raw_entry(zipf, out, copied, chunks())
+
+
+def patient_archive(patient_id: str, entries: Entries) -> Path:
+    # Regroupe par dossier de visite (<patient>/<id_operation>/...) ; les fichiers
+    # posés directement dans le dossier patient forment un groupe "files" à part.
+    visits: dict[str, Entries] = {}
+    for stored, arcname in entries:
+        parts = stored.key.split("/")
+        visits.setdefault(parts[1] if len(parts) > 2 else "files", []).append((stored, arcname))
+
+    path = CACHE_DIR / patient_id / f"patient-{manifest_digest(entries)}.zip"
+    if not path.exists():
+        archives = [visit_archive(patient_id, visit_id, visit_entries) for visit_id, visit_entries in visits.items()]
+        logging.info(f"[EXPORT CACHE] Assembling {patient_id} from {len(archives)} visit archive(s)")
+
+        def write(out):
+            with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zipf:
+                for archive in archives:
+                    _copy_entries(zipf, out, archive)
+
+        _build(path, write, "patient")
+    return path
+
+
+def archive_response(path: Path, filename: str) -> FileResponse:
+    return FileResponse(
+        path,
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Type": "application/octet-stream",
+        },
+    )
+
+
+def invalidate_exports(patient_id: str, visit_id: str | int | None = None):
+    folder = CACHE_DIR / patient_id
+    if visit_id is None:
+        shutil.rmtree(folder, ignore_errors=True)
+        return
+    for stale in list(folder.glob(f"{visit_id}-*.zip")) + list(folder.glob("patient-*.zip")):
+        try:
+            stale.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,156 @@
+import io
+import time
+import zipfile
+import zlib
+from collections import deque
+from typing import Iterable, Iterator
+
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+from app.core.storage import CHUNK_SIZE, StorageBackend, StoredFile, get_storage
+from app.core.thumbnails import is_thumbnail
+from app.core.visits import export_arcname
+from app.core.workers import get_export_pool
+
+# Formats déjà compressés : les re-deflater coûte du CPU sans rien gagner
+STORED_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+# Seules les entrées deflate jusqu'à cette taille passent par le pool (compressées en
+# mémoire) ; au plus 2 x EXPORT_POOL_WORKERS en vol, soit quelques dizaines de Mo par export
+PARALLEL_MAX_SIZE = 4 * 1024 * 1024
+
+# ---------------------
+# Streaming zip exports
+# ---------------------
+# L'archive est écrite dans un tampon non "seekable" (zipfile passe alors en mode
+# data descriptor) que le générateur vide au fil de la compression : mémoire
+# constante, premier octet envoyé dès le premier bloc, aucun fichier temporaire.
+# Les petites entrées deflate sont compressées en parallèle dans le pool d'export
+# puis écrites dans l'ordre ; les photos (stockées sans compression) et les gros
+# fichiers passent directement du stockage au flux.
+
+
+class StreamBuffer(io.RawIOBase):
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def entry_compression(stored: StoredFile, compression: int) -> int:
+    return zipfile.ZIP_STORED if stored.suffix.lower() in STORED_SUFFIXES else compression
+
+
+def compress_entry(stored: StoredFile, storage: StorageBackend) -> tuple[int, int, bytes]:
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    crc, size, parts = 0, 0, []
+    for chunk in storage.iter_chunks(stored.key):
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+        parts.append(compressor.compress(chunk))
+    parts.append(compressor.flush())
+    return crc, size, b"".join(parts)
+
+
+def _zip_info(stored: StoredFile, arcname: str, compress_type: int) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(arcname, date_time=time.localtime(stored.mtime_ns / 1e9)[:6])
+    info.compress_type = compress_type
+    info.file_size = stored.size
+    return info
+
+
+def write_raw_entry(zipf: zipfile.ZipFile, out, info: zipfile.ZipInfo, chunks: Iterable[bytes]):
+    # Entrée déjà compressée (CRC et tailles renseignés dans info) : on écrit
+    # l'en-tête local puis les données, et zipfile se charge du répertoire central.
+    info.header_offset = out.tell()
+    out.write(info.FileHeader())
+    for chunk in chunks:
+        out.write(chunk)
+    zipf.filelist.append(info)
+    zipf.NameToInfo[info.filename] = info
+    zipf.start_dir = out.tell()
+    zipf._didModify = True
+
+
+def iter_zip(
+    entries: Iterable[tuple[StoredFile, str]],
+    compression: int = zipfile.ZIP_DEFLATED,
+    storage: StorageBackend | None = None,
+) -> Iterator[bytes]:
+    storage = storage or get_storage()
+    pool = get_export_pool()
+    # Nombre d'entrées compressées d'avance : borne la mémoire tout en occupant tous les workers
+    window = 2 * max(1, settings.EXPORT_POOL_WORKERS)
+    entries = iter(entries)
+    pending = deque()
+    out = StreamBuffer()
+
+    def fill():
+        while len(pending) < window:
+            item = next(entries, None)
+            if item is None:
+                return
+            stored, arcname = item
+            compress_type = entry_compression(stored, compression)
+            future = None
+            if compress_type == zipfile.ZIP_DEFLATED and stored.size <= PARALLEL_MAX_SIZE:
+                future = pool.submit(compress_entry, stored, storage)
+            pending.append((stored, arcname, compress_type, future))
+
+    try:
+        with zipfile.ZipFile(out, "w", compression) as zipf:
+            fill()
+            while pending:
+                stored, arcname, compress_type, future = pending.popleft()
+                fill()
+                info = _zip_info(stored, arcname, compress_type)
+                if future is not None:
+                    info.CRC, info.file_size, data = future.result()
+                    info.compress_size = len(data)
+                    write_raw_entry(zipf, out, info, (data,))
+                else:
+                    # Photo stockée telle quelle ou gros fichier : en flux, sans tout garder en mémoire
+                    with zipf.open(info, "w") as dst:
+                        for chunk in storage.iter_chunks(stored.key):
+                            dst.write(chunk)
+                            if len(out.buffer) >= CHUNK_SIZE:
+                                yield out.take()
+                yield out.take()
+
+        # Répertoire central
+        yield out.take()
+    finally:
+        # Client déconnecté : inutile de finir les compressions en attente
+        for *_, future in pending:
+            if future is not None:
+                future.cancel()
+
+
+def archive_entries(files: list[StoredFile], visit_names: dict[str, str]) -> list[tuple[StoredFile, str]]:
+    return [(f, export_arcname(f.key, visit_names)) for f in files if not is_thumbnail(f.key)]
+
+
+def zip_response(entries: Iterable[tuple[StoredFile, str]], filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        iter_zip(entries),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Type": "application/octet-stream",
+        },
+    )
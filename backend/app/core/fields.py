@@ -0,0 +1,41 @@
+from fastapi import HTTPException
+
+# ---------------------
+# Sparse fieldsets
+# ---------------------
+# "?fields=position,min_return_loss_db" : le SELECT ne porte que sur ces colonnes
+# (plus la clé primaire, toujours renvoyée pour l'identification et la pagination)
+# et les lignes sont renvoyées en dictionnaires, sans hydrater d'objets ORM.
+# Sans fields, la requête et la réponse sont inchangées.
+
+
+def select_fields(model, fields: str | None) -> list | None:
+    if not fields:
+        return None
+
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    available = [column.key for column in model.__table__.columns]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown field(s) {', '.join(unknown)}; available: {', '.join(available)}",
+        )
+
+    keys = [column.key for column in model.__table__.primary_key.columns]
+    # Ordre des colonnes du modèle, sans doublons
+    wanted = set(names) | set(keys)
+    return [getattr(model, name) for name in available if name in wanted]
+
+
+def query_fields(db, model, fields: str | None):
+    columns = select_fields(model, fields)
+    return db.query(*columns) if columns else db.query(model)
+
+
+def as_fields(rows, fields: str | None):
+    if not fields:
+        return rows
+    if isinstance(rows, list):
+        return [row._asdict() for row in rows]
+    return rows._asdict() if rows is not None else None
@@ -0,0 +1,102 @@
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+from app.core.storage import StorageBackend, StoredFile, get_storage
+
+# ---------------------
+# Stored file responses
+# ---------------------
+# Sert un fichier du stockage en flux, avec validation conditionnelle (ETag /
+# Last-Modified -> 304) et requêtes partielles "Range: bytes=..." (-> 206).
+# Une seule plage est gérée ; plusieurs plages renvoient le fichier entier.
+
+
+def file_etag(stored: StoredFile) -> str:
+    return f'"{stored.size:x}-{stored.mtime_ns:x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def is_not_modified(request: Request, stored: StoredFile, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(stored.mtime_ns // 1_000_000_000) <= since
+    return False
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    start_s, _, end_s = spec.strip().partition("-")
+    try:
+        if not start_s:
+            # "bytes=-500" : les 500 derniers octets
+            length = int(end_s)
+            if length <= 0:
+                raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+            return max(size - length, 0), size - 1
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+
+def stored_file_response(
+    request: Request,
+    stored: StoredFile,
+    media_type: str | None = None,
+    storage: StorageBackend | None = None,
+) -> Response:
+    storage = storage or get_storage()
+    media_type = media_type or mimetypes.guess_type(stored.name)[0] or "application/octet-stream"
+
+    etag = file_etag(stored)
+    last_modified = formatdate(stored.mtime_ns / 1e9, usegmt=True)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Accept-Ranges": "bytes",
+        # Le navigateur garde sa copie mais revalide (304) : un fichier remplacé change d'ETag
+        "Cache-Control": "private, no-cache",
+    }
+
+    if is_not_modified(request, stored, etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range in (etag, last_modified)):
+        byte_range = parse_range(range_header, stored.size)
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{stored.size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                storage.iter_range(stored.key, start, end - start + 1),
+                status_code=206,
+                media_type=media_type,
+                headers=headers,
+            )
+
+    headers["Content-Length"] = str(stored.size)
+    return StreamingResponse(storage.iter_chunks(stored.key), media_type=media_type, headers=headers)
@@ -0,0 +1,185 @@
+import io
+import logging
+import zlib
+
+import numpy as np
+import pandas as pd
+
+KEY_COLS = ["freq", "returnloss"]
+
+# ---------------------
+# Measurement file parsing
+# ---------------------
+# Shared by the upload path (UploadFile.file) and the plot path (archived files).
+# Returns contiguous float64 arrays (freq_hz, loss_db) or None when the file
+# cannot be turned into a sweep.
+
+
+def normalize_columns(cols) -> pd.Index:
+    return pd.Index(cols).astype(str).str.strip().str.lower().str.replace(r"\s+", "", regex=True)
+
+
+def has_curve_columns(cols) -> bool:
+    return any("freq" in c for c in cols) and any("s11" in c or "returnloss" in c for c in cols)
+
+
+def infer_header_and_data(raw_df, key_cols, max_header_row=10):
+    for idx in range(min(max_header_row, len(raw_df))):
+        header = raw_df.iloc[idx].fillna("").astype(str)
+        cols = header.str.lower().str.replace(r"\s+", "", regex=True)
+        if all(any(k in c for c in cols) for k in key_cols):
+            df = raw_df.iloc[idx+1:].copy()
+            df.columns = cols
+            return df
+    return None
+
+
+def _read_table(source, suffix: str, header):
+    if suffix == "csv":
+        return pd.read_csv(source, header=header, sep=None, engine="python")
+    return pd.read_excel(source, header=header)
+
+
+def read_table(source, filename: str):
+    suffix = str(filename).split(".")[-1].lower()
+
+    tmp = _read_table(source, suffix, header=0)
+    cols = normalize_columns(tmp.columns)
+    if has_curve_columns(cols):
+        tmp.columns = cols
+        return tmp
+
+    if hasattr(source, "seek"):
+        source.seek(0)
+    raw = _read_table(source, suffix, header=None)
+    return infer_header_and_data(raw, key_cols=KEY_COLS)
+
+
+def to_float_array(col: pd.Series) -> np.ndarray:
+    if pd.api.types.is_numeric_dtype(col.dtype):
+        return col.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # Les exports VNA peuvent utiliser la virgule comme séparateur décimal
+    text = col.astype(str).str.replace(",", ".", regex=False)
+    return pd.to_numeric(text, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _column(df, name) -> pd.Series:
+    col = df[name]
+    # En-têtes dupliqués : df[name] renvoie un DataFrame
+    return col.iloc[:, 0] if isinstance(col, pd.DataFrame) else col
+
+
+def parse_measurement(source, filename: str):
+    try:
+        df = read_table(source, filename)
+    except Exception as e:
+        logging.warning(f"[PARSE] {filename}: read error {e}")
+        return None
+
+    if df is None:
+        logging.warning(f"[PARSE] {filename}: could not infer header")
+        return None
+
+    df.columns = normalize_columns(df.columns)
+    freq_cols = [c for c in df.columns if "freq" in c]
+    rl_cols = [c for c in df.columns if "s11" in c or "returnloss" in c]
+    if not freq_cols or not rl_cols:
+        logging.warning(f"[PARSE] {filename}: missing freq or return loss cols")
+        return None
+
+    freq = to_float_array(_column(df, freq_cols[0]))
+    loss = to_float_array(_column(df, rl_cols[0]))
+
+    keep = ~(np.isnan(freq) | np.isnan(loss))
+    if not keep.any():
+        logging.warning(f"[PARSE] {filename}: no numeric data after coercion")
+        return None
+
+    return np.ascontiguousarray(freq[keep]), np.ascontiguousarray(loss[keep])
+
+
+# ---------------------
+# Resonance metrics
+# ---------------------
+# extract_features travaille sur une pile 2-D de balayages (une ligne par mesure,
+# complétée par NaN) et calcule toutes les métriques en une passe vectorisée.
+# Upload, retraitement et exports analytiques passent tous par ce noyau.
+
+def stack_curves(curves: list[tuple]):
+    length = max((len(freqs) for freqs, _ in curves), default=0)
+    freqs = np.full((len(curves), length), np.nan)
+    losses = np.full((len(curves), length), np.nan)
+    for i, (f, loss) in enumerate(curves):
+        freqs[i, :len(f)] = f
+        losses[i, :len(loss)] = loss
+    return freqs, losses
+
+
+def extract_features(freqs: np.ndarray, losses: np.ndarray, threshold_db: float = -3) -> dict[str, np.ndarray]:
+    freqs = np.atleast_2d(np.asarray(freqs, dtype=np.float64))
+    losses = np.atleast_2d(np.asarray(losses, dtype=np.float64))
+    rows = np.arange(losses.shape[0])
+
+    valid = ~(np.isnan(freqs) | np.isnan(losses))
+    has_data = valid.any(axis=1)
+
+    min_idx = np.where(valid, losses, np.inf).argmin(axis=1)
+    min_rl = np.where(has_data, losses[rows, min_idx], np.nan)
+    min_freq = np.where(has_data, freqs[rows, min_idx], np.nan)
+
+    below = valid & (losses <= threshold_db)
+    f_high = np.where(below, freqs, -np.inf).max(axis=1, initial=-np.inf)
+    f_low = np.where(below, freqs, np.inf).min(axis=1, initial=np.inf)
+    bandwidth = np.where(below.any(axis=1), f_high - f_low, np.nan)
+
+    return {
+        "min_return_loss_db": min_rl,
+        "min_frequency_hz": min_freq,
+        "bandwidth_hz": bandwidth,
+    }
+
+
+def features_to_metrics(features: dict[str, np.ndarray], i: int):
+    if np.isnan(features["min_return_loss_db"][i]):
+        return None
+    bw = features["bandwidth_hz"][i]
+    return {
+        "min_return_loss_db": float(features["min_return_loss_db"][i]),
+        "min_frequency_hz": int(features["min_frequency_hz"][i]),
+        "bandwidth_hz": float(bw) if not np.isnan(bw) else None,
+    }
+
+
+def resonance_metrics(freqs: np.ndarray, losses: np.ndarray, threshold_db: float = -3):
+    return features_to_metrics(extract_features(freqs, losses, threshold_db), 0)
+
+
+# ---------------------
+# Curve storage (ResultCurve)
+# ---------------------
+
+def encode_curve(values, dtype: str = "<f8") -> bytes:
+    return zlib.compress(np.asarray(values, dtype=dtype).tobytes(), 6)
+
+
+def decode_curve(blob: bytes, dtype: str = "<f8") -> np.ndarray:
+    values = np.frombuffer(zlib.decompress(blob), dtype=dtype)
+    return values.astype(np.float64) if values.dtype.kind == "f" else values.astype(np.int64)
+
+
+# Point d'entrée des workers du pool de parsing (doit rester picklable)
+def analyse_measurement(content: bytes, filename: str):
+    curve = parse_measurement(io.BytesIO(content), filename)
+    if curve is None:
+        return None
+
+    freqs, losses = curve
+    return {
+        "metrics": resonance_metrics(freqs, losses),
+        "curve": {
+            "n_points": len(freqs),
+            "freq_hz": encode_curve(freqs),
+            "loss_db": encode_curve(losses),
+        },
+    }
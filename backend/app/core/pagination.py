@@ -0,0 +1,42 @@
+from datetime import date, datetime, time, timedelta
+
+from fastapi import HTTPException, Response
+
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# ---------------------
+# Keyset pagination
+# ---------------------
+# Pages ordonnées sur la clé primaire : "?limit=100" renvoie la première page,
+# puis "?limit=100&after=<X-Next-Cursor>" la suivante. Le corps reste la liste
+# habituelle ; le curseur suivant est dans l'en-tête X-Next-Cursor, absent sur la
+# dernière page. Sans limit, la liste complète est renvoyée comme avant (triée).
+# WHERE key > after ... LIMIT n : coût constant quelle que soit la page.
+
+
+def keyset_page(query, key_column, response: Response, limit: int | None = None, after=None) -> list:
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    if after is not None:
+        query = query.filter(key_column > after)
+    query = query.order_by(key_column)
+    if limit is None:
+        return query.all()
+
+    # Une ligne de plus pour savoir s'il reste une page, sans COUNT(*)
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = str(getattr(rows[-1], key_column.key))
+    return rows
+
+
+def filter_date_range(query, column, date_from: date | None, date_to: date | None):
+    # Bornes incluses, à la journée
+    if date_from is not None:
+        query = query.filter(column >= datetime.combine(date_from, time.min))
+    if date_to is not None:
+        query = query.filter(column < datetime.combine(date_to + timedelta(days=1), time.min))
+    return query
@@ -0,0 +1,289 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Iterator
+
+from app.core.config import settings
+
+CHUNK_SIZE = 1024 * 1024
+
+# ---------------------
+# Archive storage
+# ---------------------
+# Les fichiers des patients (mesures VNA, photos) sont adressés par une clé relative
+# "<patient_id>/<id_operation>/<position>/<fichier>", quel que soit le backend :
+# disque local sous DATA_ROOT ou bucket S3 compatible (AWS, MinIO...). Lectures
+# et écritures passent par blocs de CHUNK_SIZE, jamais par un fichier entier en mémoire.
+
+
+@dataclass
+class StoredFile:
+    key: str
+    size: int
+    mtime_ns: int
+
+    @property
+    def name(self) -> str:
+        return PurePosixPath(self.key).name
+
+    @property
+    def suffix(self) -> str:
+        return PurePosixPath(self.key).suffix
+
+
+def join_key(*parts) -> str:
+    return "/".join(str(p).strip("/") for p in parts if str(p).strip("/"))
+
+
+class StorageBackend(ABC):
+    @abstractmethod
+    def save(self, key: str, source: BinaryIO):
+        raise NotImplementedError
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        raise NotImplementedError
+
+    @abstractmethod
+    def stat(self, key: str) -> StoredFile | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_files(self, prefix: str, recursive: bool = False) -> list[StoredFile]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def is_dir(self, prefix: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def make_dirs(self, prefix: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str):
+        raise NotImplementedError
+
+    def iter_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        with self.open(key) as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    def iter_range(self, key: str, start: int, length: int, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        with self.open(key) as f:
+            f.seek(start)
+            while length > 0 and (chunk := f.read(min(chunk_size, length))):
+                length -= len(chunk)
+                yield chunk
+
+    def read_bytes(self, key: str) -> bytes:
+        with self.open(key) as f:
+            return f.read()
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        return self.root.joinpath(*PurePosixPath(key).parts)
+
+    def _stored(self, path: Path, stat: os.stat_result) -> StoredFile:
+        return StoredFile(path.relative_to(self.root).as_posix(), stat.st_size, stat.st_mtime_ns)
+
+    def save(self, key: str, source: BinaryIO):
+        target = self.path(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        # Écriture dans un fichier temporaire puis remplacement : un lecteur ne voit jamais un fichier à moitié écrit
+        fd, tmp_name = tempfile.mkstemp(dir=target.parent, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out_f:
+                shutil.copyfileobj(source, out_f, CHUNK_SIZE)
+            os.replace(tmp_name, target)
+        except Exception:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    def stat(self, key: str) -> StoredFile | None:
+        path = self.path(key)
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return self._stored(path, stat) if path.is_file() else None
+
+    def list_files(self, prefix: str, recursive: bool = False) -> list[StoredFile]:
+        base = self.path(prefix)
+        if not base.is_dir():
+            return []
+        files = []
+        for f in (base.rglob("*") if recursive else base.iterdir()):
+            if f.is_file() and f.suffix != ".part":
+                files.append(self._stored(f, f.stat()))
+        return sorted(files, key=lambda s: s.key)
+
+    def is_dir(self, prefix: str) -> bool:
+        return self.path(prefix).is_dir()
+
+    def make_dirs(self, prefix: str):
+        self.path(prefix).mkdir(parents=True, exist_ok=True)
+
+    def delete(self, key: str):
+        self.path(key).unlink(missing_ok=True)
+
+    def delete_prefix(self, prefix: str):
+        path = self.path(prefix)
+        if path.exists():
+            shutil.rmtree(path)
+
+
+class S3Storage(StorageBackend):
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str | None = None, region: str | None = None):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        # Identifiants : chaîne standard boto3 (AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY, profil, rôle)
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.transfer_config = TransferConfig(multipart_chunksize=8 * CHUNK_SIZE, io_chunksize=CHUNK_SIZE)
+
+    def _key(self, key: str) -> str:
+        return join_key(self.prefix, key)
+
+    def _relative(self, s3_key: str) -> str:
+        return s3_key[len(self.prefix) + 1:] if self.prefix else s3_key
+
+    def _is_missing(self, error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def save(self, key: str, source: BinaryIO):
+        # upload_fileobj découpe le flux en parts multipart, sans le charger en entier
+        self.client.upload_fileobj(source, self.bucket, self._key(key), Config=self.transfer_config)
+
+    def open(self, key: str) -> BinaryIO:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+        except ClientError as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def iter_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        body = self.open(key)
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def iter_range(self, key: str, start: int, length: int, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        # Range côté serveur : seuls les octets demandés transitent
+        body = self.client.get_object(
+            Bucket=self.bucket, Key=self._key(key), Range=f"bytes={start}-{start + length - 1}"
+        )["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def stat(self, key: str) -> StoredFile | None:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return StoredFile(key, head["ContentLength"], int(head["LastModified"].timestamp() * 1e9))
+
+    def _dir_key(self, prefix: str) -> str:
+        base = self._key(prefix)
+        return f"{base}/" if base else ""
+
+    def _iter_objects(self, prefix: str, recursive: bool):
+        params = {"Bucket": self.bucket, "Prefix": self._dir_key(prefix)}
+        if not recursive:
+            params["Delimiter"] = "/"
+        for page in self.client.get_paginator("list_objects_v2").paginate(**params):
+            yield from page.get("Contents", [])
+
+    def list_files(self, prefix: str, recursive: bool = False) -> list[StoredFile]:
+        files = [
+            StoredFile(self._relative(obj["Key"]), obj["Size"], int(obj["LastModified"].timestamp() * 1e9))
+            for obj in self._iter_objects(prefix, recursive)
+            # Marqueurs de dossier posés par make_dirs
+            if not obj["Key"].endswith("/")
+        ]
+        return sorted(files, key=lambda s: s.key)
+
+    def is_dir(self, prefix: str) -> bool:
+        # Un "dossier" existe s'il contient au moins un objet (fichier ou marqueur make_dirs)
+        page = self.client.list_objects_v2(Bucket=self.bucket, Prefix=self._dir_key(prefix), MaxKeys=1)
+        return page.get("KeyCount", 0) > 0
+
+    def make_dirs(self, prefix: str):
+        # Objet vide "<prefix>/" : même convention que la console S3, pour que is_dir
+        # distingue une visite créée d'une visite inexistante comme en local
+        if prefix:
+            self.client.put_object(Bucket=self.bucket, Key=self._dir_key(prefix), Body=b"")
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def delete_prefix(self, prefix: str):
+        keys = [{"Key": obj["Key"]} for obj in self._iter_objects(prefix, recursive=True)]
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": keys[start:start + 1000]})
+
+
+def sha256_stream(source: BinaryIO) -> str:
+    # Empreinte d'un upload (fichier temporaire de FastAPI) avant tout écriture en stockage
+    digest = hashlib.sha256()
+    source.seek(0)
+    while chunk := source.read(CHUNK_SIZE):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+_storage: StorageBackend | None = None
+_lock = threading.Lock()
+
+
+def get_storage() -> StorageBackend:
+    global _storage
+    with _lock:
+        if _storage is None:
+            if settings.STORAGE_BACKEND == "s3":
+                if not settings.S3_BUCKET:
+                    raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+                _storage = S3Storage(
+                    settings.S3_BUCKET,
+                    prefix=settings.S3_PREFIX,
+                    endpoint_url=settings.S3_ENDPOINT_URL,
+                    region=settings.S3_REGION,
+                )
+            else:
+                _storage = LocalStorage(settings.DATA_ROOT)
+            logging.info(f"[STORAGE] Using {type(_storage).__name__}")
+        return _storage
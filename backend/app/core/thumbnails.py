@@ -0,0 +1,105 @@
+import io
+import logging
+
+from PIL import Image, ImageOps
+
+from app.core.storage import StoredFile, get_storage, join_key
+from app.core.workers import get_thumbnail_pool
+
+THUMBNAIL_SIZES = (160, 480, 1024)
+THUMBS_DIR = ".thumbs"
+
+# ---------------------
+# Photo thumbnails
+# ---------------------
+# Vignettes JPEG (côté le plus long = taille) rangées à côté des originaux :
+#   <visite>/photos/.thumbs/<taille>/<nom original>.jpg
+# Générées après l'upload dans le pool de vignettes, puis à la demande si une
+# vignette manque ou est plus ancienne que l'original.
+# Pas de vignette aux tailles >= au côté le plus long de l'original, ni quand le
+# JPEG obtenu n'est pas plus léger que l'original : l'original est servi à la place
+# et la taille n'est pas annoncée dans la liste.
+
+
+def thumbnail_key(photo_key: str, size: int) -> str:
+    parent, _, name = photo_key.rpartition("/")
+    return join_key(parent, THUMBS_DIR, size, f"{name}.jpg")
+
+
+def is_thumbnail(key: str) -> bool:
+    return f"/{THUMBS_DIR}/" in f"/{key}"
+
+
+def is_fresh(thumb: StoredFile | None, original: StoredFile) -> bool:
+    return thumb is not None and thumb.mtime_ns >= original.mtime_ns
+
+
+def generate_thumbnails(photo_key: str, sizes=THUMBNAIL_SIZES) -> bool:
+    storage = get_storage()
+    try:
+        content = storage.read_bytes(photo_key)
+        with Image.open(io.BytesIO(content)) as img:
+            long_edge = max(img.size)
+            # Décodage JPEG directement à échelle réduite quand c'est possible
+            img.draft("RGB", (max(sizes), max(sizes)))
+            img = ImageOps.exif_transpose(img).convert("RGB")
+
+        for size in sorted(sizes, reverse=True):
+            key = thumbnail_key(photo_key, size)
+            buf = None
+            if size < long_edge:
+                thumb = img.copy()
+                thumb.thumbnail((size, size), Image.LANCZOS)
+                buf = io.BytesIO()
+                thumb.save(buf, "JPEG", quality=82, optimize=True)
+            if buf is None or buf.tell() >= len(content):
+                # Vignette inutile : on retire une éventuelle version d'un ancien original
+                storage.delete(key)
+                continue
+            buf.seek(0)
+            storage.save(key, buf)
+        return True
+    except Exception as e:
+        logging.warning(f"[THUMBNAILS] {photo_key}: {e}")
+        return False
+
+
+def schedule_thumbnails(photo_keys: list[str]):
+    pool = get_thumbnail_pool()
+    for key in photo_keys:
+        pool.submit(generate_thumbnails, key)
+
+
+def ensure_thumbnail(original: StoredFile, size: int) -> StoredFile:
+    storage = get_storage()
+    thumbs = {s: storage.stat(thumbnail_key(original.key, s)) for s in THUMBNAIL_SIZES}
+    if is_fresh(thumbs[size], original):
+        return thumbs[size]
+    # Toutes les tailles sont générées ensemble : si une autre est à jour, celle-ci a
+    # été écartée (trop grande ou pas plus légère) et l'original est servi
+    if not any(is_fresh(thumb, original) for thumb in thumbs.values()):
+        generate_thumbnails(original.key)
+        thumb = storage.stat(thumbnail_key(original.key, size))
+        if is_fresh(thumb, original):
+            return thumb
+    # Taille écartée ou image illisible par Pillow : l'original plutôt qu'une erreur
+    return original
+
+
+def list_thumbnails(photos_dir: str) -> dict[int, dict[str, StoredFile]]:
+    # Une liste par taille, pour annoncer les vignettes sans ouvrir les images
+    storage = get_storage()
+    return {
+        size: {f.name: f for f in storage.list_files(join_key(photos_dir, THUMBS_DIR, size))}
+        for size in THUMBNAIL_SIZES
+    }
+
+
+def thumbnail_sizes(original: StoredFile, thumbs: dict[int, dict[str, StoredFile]]) -> list[int]:
+    return [size for size in THUMBNAIL_SIZES if is_fresh(thumbs[size].get(f"{original.name}.jpg"), original)]
+
+
+def delete_thumbnails(photo_key: str):
+    storage = get_storage()
+    for size in THUMBNAIL_SIZES:
+        storage.delete(thumbnail_key(photo_key, size))
@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.core.storage import get_storage, join_key
+from app.db.models import Operation
+
+VISIT_PATH_CACHE_SIZE = 1024
+
+# ---------------------
+# Visit numbering
+# ---------------------
+# visit_number (ordre chronologique des opérations d'un patient) et visit_str
+# ("{n}-{nom}_{ddmmyyyy}", nom lisible de la visite) sont stockés sur Operation
+# et recalculés uniquement quand l'ordre ou le nom d'une visite change.
+# En stockage une visite vit sous <patient_id>/<id_operation>/ : le nom
+# lisible n'apparaît que dans les exports, insérer ou renommer une visite ne
+# déplace donc aucun dossier.
+
+
+def format_visit_str(visit_number: int, op: Operation) -> str:
+    return f"{visit_number}-{op.name.replace(' ', '_')}_{op.operation_date.strftime('%d%m%Y')}"
+
+
+def renumber_visits(db: Session, patient_id: str) -> list[Operation]:
+    ops = (
+        db.query(Operation)
+        .filter(Operation.patient_id == patient_id)
+        .order_by(Operation.operation_date.asc(), Operation.id_operation.asc())
+        .all()
+    )
+    for i, op in enumerate(ops, start=1):
+        visit_str = format_visit_str(i, op)
+        if op.visit_number != i or op.visit_str != visit_str:
+            op.visit_number = i
+            op.visit_str = visit_str
+    return ops
+
+
+def visit_folder(patient_id: str, id_operation: int) -> str:
+    return join_key(patient_id, id_operation)
+
+
+def ensure_visit_str(db: Session, op: Operation) -> str:
+    # Opérations créées avant l'ajout des colonnes : numérotation calculée une fois
+    if op.visit_str is None:
+        renumber_visits(db, op.patient_id)
+        db.commit()
+    return op.visit_str
+
+
+# ---------------------
+# Visit path resolver
+# ---------------------
+# Cache LRU en mémoire (id_operation, position) -> clé de dossier déjà vérifiée en stockage.
+# Un hit ne fait ni requête ni appel système ; les routes qui suppriment des
+# opérations ou des patients appellent invalidate_visit_paths.
+
+_visit_paths: OrderedDict[tuple[int, int | None], str] = OrderedDict()
+_visit_paths_lock = threading.Lock()
+
+
+def get_visit_path(db: Session, id_operation: int, position: int | None = None, create: bool = False) -> str:
+    key = (id_operation, position)
+    with _visit_paths_lock:
+        cached = _visit_paths.get(key)
+        if cached is not None:
+            _visit_paths.move_to_end(key)
+            return cached
+
+    operation = db.query(Operation).filter(Operation.id_operation == id_operation).first()
+    if not operation:
+        raise HTTPException(status_code=404, detail=f"Operation {id_operation} not found")
+
+    visit_dir = visit_folder(operation.patient_id, id_operation)
+    if position is not None:
+        visit_dir = join_key(visit_dir, position)
+
+    storage = get_storage()
+    if create:
+        storage.make_dirs(visit_dir)
+    elif not storage.is_dir(visit_dir):
+        raise HTTPException(status_code=404, detail=f"Visit folder not found: {visit_dir}")
+
+    with _visit_paths_lock:
+        _visit_paths[key] = visit_dir
+        _visit_paths.move_to_end(key)
+        while len(_visit_paths) > VISIT_PATH_CACHE_SIZE:
+            _visit_paths.popitem(last=False)
+    return visit_dir
+
+
+def invalidate_visit_paths(*id_operations: int):
+    with _visit_paths_lock:
+        if not id_operations:
+            _visit_paths.clear()
+            return
+        for key in [k for k in _visit_paths if k[0] in id_operations]:
+            del _visit_paths[key]
+
+
+# ---------------------
+# Export names
+# ---------------------
+
+def visit_export_names(db: Session, patient_id: str) -> dict[str, str]:
+    ops = db.query(Operation).filter(Operation.patient_id == patient_id).all()
+    if any(op.visit_str is None for op in ops):
+        renumber_visits(db, patient_id)
+        db.commit()
+    return {str(op.id_operation): op.visit_str for op in ops}
+
+
+def export_arcname(key: str, visit_names: dict[str, str]) -> str:
+    # <patient>/<id_operation>/... -> <patient>/<visit_str>/... dans l'archive
+    parts = key.split("/")
+    if len(parts) > 1 and parts[1] in visit_names:
+        parts[1] = visit_names[parts[1]]
+    return "/".join(parts)
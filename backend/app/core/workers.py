@@ -0,0 +1,63 @@
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.core.config import settings
+
+# ---------------------
+# Shared worker pools
+# ---------------------
+# Created lazily so importing the API modules (or the worker processes
+# themselves) never spawns anything.
+
+_parse_pool: Executor | None = None
+_thumbnail_pool: ThreadPoolExecutor | None = None
+_export_pool: ThreadPoolExecutor | None = None
+_lock = threading.Lock()
+
+
+def get_parse_pool() -> Executor:
+    global _parse_pool
+    with _lock:
+        if _parse_pool is None:
+            workers = max(1, settings.PARSE_POOL_WORKERS)
+            if settings.PARSE_POOL_KIND == "thread":
+                _parse_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="parse")
+            else:
+                _parse_pool = ProcessPoolExecutor(max_workers=workers)
+        return _parse_pool
+
+
+def get_thumbnail_pool() -> ThreadPoolExecutor:
+    # Threads : Pillow relâche le GIL pendant le décodage et le redimensionnement
+    global _thumbnail_pool
+    with _lock:
+        if _thumbnail_pool is None:
+            _thumbnail_pool = ThreadPoolExecutor(
+                max_workers=max(1, settings.THUMBNAIL_POOL_WORKERS), thread_name_prefix="thumbnails"
+            )
+        return _thumbnail_pool
+
+
+def get_export_pool() -> ThreadPoolExecutor:
+    # Threads : zlib relâche le GIL pendant la compression
+    global _export_pool
+    with _lock:
+        if _export_pool is None:
+            _export_pool = ThreadPoolExecutor(
+                max_workers=max(1, settings.EXPORT_POOL_WORKERS), thread_name_prefix="export"
+            )
+        return _export_pool
+
+
+def shutdown_pools():
+    global _parse_pool, _thumbnail_pool, _export_pool
+    with _lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=False, cancel_futures=True)
+            _parse_pool = None
+        if _thumbnail_pool is not None:
+            _thumbnail_pool.shutdown(wait=False, cancel_futures=True)
+            _thumbnail_pool = None
+        if _export_pool is not None:
+            _export_pool.shutdown(wait=False, cancel_futures=True)
+            _export_pool = None
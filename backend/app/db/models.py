@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Enum, ForeignKey, LargeBinary, Index
+from sqlalchemy.orm import relationship
 from app.db.database import Base
 import enum
 from datetime import datetime, timezone
@@ -73,6 +74,13 @@ class Operation(Base):
     name = Column(String)
     operation_date = Column(DateTime)
     notes = Column(String)
+    visit_number = Column(Integer)
+    visit_str = Column(String)
+
+    __table_args__ = (
+        Index("ix_operations_patient", "patient_id", "id_operation"),
+        Index("ix_operations_date", "operation_date"),
+    )
 
 
 # ---------------------
@@ -89,6 +97,46 @@ class Result(Base):
     min_frequency_hz = Column(Float)
     bandwidth_hz = Column(Float)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
+    file_name = Column(String)
+    sha256 = Column(String(64))
+
+    curve = relationship("ResultCurve", uselist=False, cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_results_operation_position", "id_operation", "position", "measurement_number"),
+        Index("ix_results_operation_sha256", "id_operation", "sha256"),
+    )
+
+
+# ---------------------
+# RESULT CURVES
+# ---------------------
+# Full S11 sweep of a Result: little-endian float64 arrays, zlib-compressed
+class ResultCurve(Base):
+    __tablename__ = "result_curves"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    result_id = Column(Integer, ForeignKey("results.id", ondelete="CASCADE"), nullable=False, unique=True, index=True)
+    n_points = Column(Integer, nullable=False)
+    freq_hz = Column(LargeBinary, nullable=False)
+    loss_db = Column(LargeBinary, nullable=False)
+
+
+# ---------------------
+# POSITION AVERAGES
+# ---------------------
+# Running sum / count of the sweeps of one (operation, position), per frequency index.
+# Average curve = loss_sum / point_count.
+class PositionAverage(Base):
+    __tablename__ = "position_averages"
+
+    id_operation = Column(Integer, ForeignKey("operations.id_operation", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    n_measurements = Column(Integer, nullable=False, default=0)
+    freq_hz = Column(LargeBinary, nullable=False)
+    loss_sum = Column(LargeBinary, nullable=False)
+    point_count = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
 
 # ---------------------
@@ -101,3 +149,8 @@ class Photo(Base):
     id_operation = Column(Integer, ForeignKey("operations.id_operation"), nullable=False)        
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     filename = Column(String, nullable=False)
+    sha256 = Column(String(64))
+
+    __table_args__ = (
+        Index("ix_photos_operation_sha256", "id_operation", "sha256"),
+    )
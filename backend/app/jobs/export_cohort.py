@@ -0,0 +1,75 @@
+import argparse
+import logging
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.core.cohort import COHORT_FORMATS, cohort_batches, open_writer
+from app.db.database import SessionLocal
+
+# ---------------------
+# Export the cohort dataset
+# ---------------------
+# Même contenu que POST /patients/export-cohort/, écrit sur disque :
+#   - un seul fichier (Parquet, un row group par patient, ou flux Arrow IPC) ;
+#   - avec --partitioned, un dossier Parquet partitionné à la Hive
+#     (<sortie>/patient_id=MV001/part-0.parquet), lisible avec
+#     pyarrow.dataset / pandas.read_parquet / arrow::open_dataset.
+#
+#   python -m app.jobs.export_cohort cohort.parquet [--patient MV001] [--format arrow] [--partitioned]
+
+logger = logging.getLogger("export_cohort")
+
+
+def write_partitioned(db, output: Path, patient_ids: list[str] | None) -> int:
+    n_rows = 0
+    for batch in cohort_batches(db, patient_ids):
+        patient_id = batch.column(0)[0].as_py()
+        partition = output / f"patient_id={patient_id}"
+        partition.mkdir(parents=True, exist_ok=True)
+        # La colonne de partition est portée par le nom du dossier
+        table = pa.Table.from_batches([batch]).drop_columns(["patient_id"])
+        pq.write_table(table, partition / "part-0.parquet", compression="zstd")
+        n_rows += batch.num_rows
+    return n_rows
+
+
+def write_single(db, output: Path, patient_ids: list[str] | None, fmt: str) -> int:
+    output.parent.mkdir(parents=True, exist_ok=True)
+    n_rows = 0
+    with open(output, "wb") as sink:
+        writer = open_writer(sink, fmt)
+        for batch in cohort_batches(db, patient_ids):
+            writer.write_batch(batch)
+            n_rows += batch.num_rows
+        writer.close()
+    return n_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export patients, operations, results and sweeps as a columnar dataset")
+    parser.add_argument("output", type=Path, help="Output file, or directory with --partitioned")
+    parser.add_argument("--patient", action="append", help="Only export this patient (repeatable)")
+    parser.add_argument("--format", choices=COHORT_FORMATS, default="parquet")
+    parser.add_argument("--partitioned", action="store_true", help="One Parquet file per patient (Hive layout)")
+    args = parser.parse_args(argv)
+
+    if args.partitioned and args.format != "parquet":
+        parser.error("--partitioned only applies to --format parquet")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    db = SessionLocal()
+    try:
+        if args.partitioned:
+            n_rows = write_partitioned(db, args.output, args.patient)
+        else:
+            n_rows = write_single(db, args.output, args.patient, args.format)
+        logger.info(f"[COHORT] {n_rows} result(s) written to {args.output}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
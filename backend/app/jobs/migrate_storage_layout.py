@@ -0,0 +1,105 @@
+import argparse
+import logging
+import re
+from pathlib import Path
+
+from app.core import curve_cache
+from app.core.config import settings
+from app.core.storage import join_key
+from app.core.visits import renumber_visits, visit_folder
+from app.db.database import SessionLocal
+from app.db.models import Operation
+
+# ---------------------
+# Migrate visit folders to the id-based layout
+# ---------------------
+# Déplace les dossiers "{n}-{nom}_{ddmmyyyy}" vers DATA_ROOT/<patient_id>/<id_operation>/.
+# Idempotent : une visite déjà migrée est ignorée, un dossier cible existant
+# (sous-dossiers vides créés par la nouvelle API) est fusionné.
+#
+# Ne concerne que le stockage local : les anciens dossiers n'ont jamais existé dans S3.
+#
+#   python -m app.jobs.migrate_storage_layout [--patient MV001] [--dry-run]
+
+logger = logging.getLogger("migrate_storage_layout")
+
+
+def find_legacy_folder(patient_folder: Path, op: Operation) -> Path | None:
+    if op.visit_str and (patient_folder / op.visit_str).is_dir():
+        return patient_folder / op.visit_str
+
+    suffix = f"{op.name.replace(' ', '_')}_{op.operation_date.strftime('%d%m%Y')}"
+    for folder in patient_folder.glob(f"*-{suffix}"):
+        if folder.is_dir() and re.fullmatch(rf"\d+-{re.escape(suffix)}", folder.name):
+            return folder
+    return None
+
+
+def merge_into(source: Path, target: Path):
+    if not target.exists():
+        source.rename(target)
+        return
+
+    for item in source.iterdir():
+        dest = target / item.name
+        if item.is_dir() and dest.is_dir():
+            merge_into(item, dest)
+        elif dest.exists():
+            logger.warning(f"[MIGRATE] {dest} already exists, keeping {item} in place")
+        else:
+            item.rename(dest)
+    if not any(source.iterdir()):
+        source.rmdir()
+
+
+def migrate_operation(data_root: Path, op: Operation, dry_run: bool = False) -> bool:
+    legacy = find_legacy_folder(data_root / op.patient_id, op)
+    if legacy is None:
+        return False
+
+    target = data_root.joinpath(*visit_folder(op.patient_id, op.id_operation).split("/"))
+    logger.info(f"[MIGRATE] {legacy} -> {target}")
+    if dry_run:
+        return True
+
+    # Les entrées du cache de courbes sont indexées par chemin : celles de l'ancien dossier deviennent orphelines
+    for sub in legacy.iterdir():
+        if sub.is_dir():
+            curve_cache.invalidate_folder(join_key(op.patient_id, legacy.name, sub.name))
+    merge_into(legacy, target)
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move visit folders to DATA_ROOT/<patient_id>/<id_operation>")
+    parser.add_argument("--patient", action="append", help="Only migrate this patient (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="Print the moves without touching the disk")
+    args = parser.parse_args(argv)
+
+    if settings.STORAGE_BACKEND != "local":
+        parser.error("the layout migration only applies to STORAGE_BACKEND=local")
+    data_root = Path(settings.DATA_ROOT)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    db = SessionLocal()
+    try:
+        query = db.query(Operation).order_by(Operation.patient_id, Operation.id_operation)
+        if args.patient:
+            query = query.filter(Operation.patient_id.in_(args.patient))
+        operations = query.all()
+
+        # Les opérations créées avant visit_str ont besoin de leur numéro pour les exports
+        for patient_id in {op.patient_id for op in operations if op.visit_str is None}:
+            renumber_visits(db, patient_id)
+        if not args.dry_run:
+            db.commit()
+
+        moved = sum(migrate_operation(data_root, op, args.dry_run) for op in operations)
+        logger.info(f"[MIGRATE] {moved}/{len(operations)} visit folder(s) moved")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import hashlib
+import io
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path, PurePosixPath
+
+from fastapi import HTTPException
+
+from app.api.results import VALID_EXTS
+from app.core import curve_cache
+from app.core.averages import store_position_average
+from app.core.config import settings
+from app.core.storage import get_storage
+from app.core.measurements import (
+    parse_measurement,
+    stack_curves,
+    extract_features,
+    features_to_metrics,
+    encode_curve,
+)
+from app.core.visits import get_visit_path
+from app.db.database import SessionLocal
+from app.db.models import Operation, Result, ResultCurve
+
+# ---------------------
+# Reprocess archived measurements
+# ---------------------
+# Recalcule les métriques (et courbes stockées / moyennes par position) de la table
+# results à partir des fichiers archivés (stockage local ou S3), sans ré-upload.
+#
+#   python -m app.jobs.reprocess_results [--patient MV001] [--workers 8] [--resume]
+
+logger = logging.getLogger("reprocess_results")
+
+# À côté du cache de courbes, hors de l'arborescence du code
+DEFAULT_STATE_FILE = Path(settings.DATA_ROOT) / ".reprocess_state.json"
+
+
+def parse_archived_file(key: str):
+    content = get_storage().read_bytes(key)
+    return hashlib.sha256(content).hexdigest(), parse_measurement(io.BytesIO(content), key)
+
+
+def load_state(state_file: Path) -> set[int]:
+    if not state_file.exists():
+        return set()
+    return set(json.loads(state_file.read_text()).get("done", []))
+
+
+def save_state(state_file: Path, done: set[int]):
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = state_file.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"done": sorted(done)}))
+    tmp.replace(state_file)
+
+
+def collect_files(db, operations: list[Operation]) -> list[tuple]:
+    tasks = []
+    for op in operations:
+        for pos in range(1, 7):
+            try:
+                position_dir = get_visit_path(db, op.id_operation, pos)
+            except HTTPException:
+                continue
+            for f in get_storage().list_files(position_dir):
+                if f.suffix.lower() in VALID_EXTS:
+                    tasks.append((op.id_operation, pos, f.key))
+    return tasks
+
+
+def match_results(results: list[Result], tasks: list[tuple], digests: list[str]) -> list[Result | None]:
+    # Fichier -> ligne results par nom de fichier, sinon par SHA-256 du contenu.
+    # Les lignes antérieures à file_name gardent la règle de l'API : le n-ième
+    # fichier de la position, par ordre des noms, est la mesure n.
+    by_name = {(r.id_operation, r.position, r.file_name): r for r in results if r.file_name}
+    by_digest = {(r.id_operation, r.position, r.sha256): r for r in results if r.sha256}
+    by_number = {(r.id_operation, r.position, r.measurement_number): r for r in results if not r.file_name}
+
+    matched, used, ranks = [], set(), {}
+    for (id_operation, pos, key), digest in zip(tasks, digests):
+        rank = ranks[(id_operation, pos)] = ranks.get((id_operation, pos), 0) + 1
+        candidates = (
+            by_name.get((id_operation, pos, PurePosixPath(key).name)),
+            by_digest.get((id_operation, pos, digest)),
+            by_number.get((id_operation, pos, rank)),
+        )
+        # Deux fichiers ne peuvent pas réécrire la même ligne
+        result = next((r for r in candidates if r is not None and r.id not in used), None)
+        if result is not None:
+            used.add(result.id)
+        matched.append(result)
+    return matched
+
+
+def reprocess_batch(db, pool, operations: list[Operation]) -> int:
+    tasks = collect_files(db, operations)
+    if not tasks:
+        return 0
+
+    parsed_files = list(pool.map(parse_archived_file, [t[2] for t in tasks], chunksize=8))
+    digests = [digest for digest, _ in parsed_files]
+
+    op_ids = [op.id_operation for op in operations]
+    results = db.query(Result).filter(Result.id_operation.in_(op_ids)).all()
+    matched = match_results(results, tasks, digests)
+
+    parsed = []
+    for task, (digest, curve), result in zip(tasks, parsed_files, matched):
+        if curve is None:
+            logger.warning(f"[REPROCESS] Skipping unreadable file {task[2]}")
+        else:
+            parsed.append((task, digest, curve, result))
+    if not parsed:
+        return 0
+
+    features = extract_features(*stack_curves([curve for _, _, curve, _ in parsed]))
+
+    last_numbers = {}
+    for r in results:
+        key = (r.id_operation, r.position)
+        last_numbers[key] = max(last_numbers.get(key, 0), r.measurement_number or 0)
+
+    touched = {}
+    for i, ((id_operation, pos, path), digest, (freqs, losses), result) in enumerate(parsed):
+        metrics = features_to_metrics(features, i)
+        if metrics is None:
+            continue
+
+        if result is None:
+            # Fichier archivé sans ligne results : nouvelle mesure après les existantes
+            number = last_numbers[(id_operation, pos)] = last_numbers.get((id_operation, pos), 0) + 1
+            result = Result(id_operation=id_operation, position=pos, measurement_number=number)
+            db.add(result)
+            logger.info(f"[REPROCESS] Inserted measurement {number} for {path}")
+
+        # Lignes antérieures aux colonnes file_name / sha256 : on complète
+        result.file_name = PurePosixPath(path).name
+        result.sha256 = digest
+        for key, value in metrics.items():
+            setattr(result, key, value)
+
+        blobs = {"n_points": len(freqs), "freq_hz": encode_curve(freqs), "loss_db": encode_curve(losses)}
+        if result.curve is None:
+            result.curve = ResultCurve(**blobs)
+        else:
+            for key, value in blobs.items():
+                setattr(result.curve, key, value)
+
+        touched.setdefault((id_operation, pos), []).append((freqs, losses))
+        curve_cache.invalidate_file(path)
+
+    for (id_operation, pos), measure_arrays in touched.items():
+        store_position_average(db, id_operation, pos, measure_arrays)
+
+    db.commit()
+    return len(parsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute results metrics from the archived measurement files")
+    parser.add_argument("--patient", action="append", help="Only reprocess this patient (repeatable)")
+    parser.add_argument("--workers", type=int, default=settings.PARSE_POOL_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=20, help="Operations per commit")
+    parser.add_argument("--resume", action="store_true", help="Skip operations completed by a previous run")
+    parser.add_argument("--state-file", type=Path, default=DEFAULT_STATE_FILE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    done = load_state(args.state_file) if args.resume else set()
+    db = SessionLocal()
+    try:
+        query = db.query(Operation).order_by(Operation.id_operation)
+        if args.patient:
+            query = query.filter(Operation.patient_id.in_(args.patient))
+        operations = [op for op in query.all() if op.id_operation not in done]
+
+        total = len(operations)
+        n_files = 0
+        logger.info(f"[REPROCESS] {total} operation(s) to process, {len(done)} already done")
+
+        with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            for start in range(0, total, args.batch_size):
+                batch = operations[start:start + args.batch_size]
+                try:
+                    n_files += reprocess_batch(db, pool, batch)
+                except Exception:
+                    db.rollback()
+                    raise
+
+                done.update(op.id_operation for op in batch)
+                save_state(args.state_file, done)
+                logger.info(f"[REPROCESS] {min(start + len(batch), total)}/{total} operations, {n_files} file(s)")
+
+        logger.info("[REPROCESS] Completed")
+        if args.state_file.exists():
+            args.state_file.unlink()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -57,6 +57,25 @@ def get_operation(id_operation):
     print("Status:", r.status_code)
     print("Response:", r.json())
 
+# ---------------------
+# LIST OPERATIONS (KEYSET PAGINATION)
+# ---------------------
+def list_operations_paginated(patient_id, limit=1):
+    print_section(f"LIST OPERATIONS OF {patient_id} (limit={limit})")
+    ids, cursor = [], None
+    while True:
+        params = {"patient_id": patient_id, "limit": limit}
+        if cursor:
+            params["after"] = cursor
+        r = requests.get(f"{OPERATIONS_URL}/", params=params)
+        ids += [op["id_operation"] for op in r.json()]
+        cursor = r.headers.get("X-Next-Cursor")
+        print("Status:", r.status_code, "Page:", [op["id_operation"] for op in r.json()], "Next:", cursor)
+        if not cursor:
+            break
+    print("All ids:", ids)
+    return ids
+
 # ---------------------
 # UPDATE OPERATION
 # ---------------------
@@ -132,6 +151,9 @@ if __name__ == "__main__":
     get_operation(op1)
     get_operation(op2)
 
+    # list them page by page
+    list_operations_paginated(pid)
+
     # update one
     update_operation(op1, "Visit_1_updated")
 
@@ -35,6 +35,13 @@ def test_get_patient(patient_id):
     print("Response:", r.json())
 
 
+def test_get_patient_fields(patient_id, fields="age,bmi"):
+    r = requests.get(f"{API_URL}/{patient_id}", params={"fields": fields})
+    print("\n=== GET PATIENT (fields=%s) ===" % fields)
+    print("Status:", r.status_code)
+    print("Response:", r.json())
+
+
 # ---------------------
 # UPDATE PATIENT
 # ---------------------
@@ -83,6 +90,16 @@ def test_export_patient_folder(patient_id):
             print("Response (raw):", r.text)
 
 
+def test_export_patient_cached(patient_id):
+    # Deuxième téléchargement sans modification : archive servie depuis le cache
+    first = requests.get(f"{API_URL}/export-folder/{patient_id}")
+    second = requests.get(f"{API_URL}/export-folder/{patient_id}")
+    print("\n=== EXPORT PATIENT FOLDER (CACHED) ===")
+    print("Status:", first.status_code, second.status_code)
+    print("Identical archives:", first.content == second.content)
+    print("Content-Length:", second.headers.get("content-length"))
+
+
 # ---------------------
 # EXPORT MULTIPLE PATIENTS
 # ---------------------
@@ -104,6 +121,23 @@ def test_export_multiple_patients(ids):
             print("Response (raw):", r.text)
 
 
+# ---------------------
+# EXPORT COHORT (PARQUET)
+# ---------------------
+def test_export_cohort(ids):
+    r = requests.post(f"{API_URL}/export-cohort/", json={"patient_ids": ids, "format": "parquet"})
+    print("\n=== EXPORT COHORT ===")
+    print("Status:", r.status_code)
+
+    if r.status_code == 200:
+        filename = "cohort.parquet"
+        with open(filename, "wb") as f:
+            f.write(r.content)
+        print(f"Parquet sauvegardé sous '{filename}' ({len(r.content)} octets)")
+    else:
+        print("Response (raw):", r.text)
+
+
 # ---------------------
 # DELETE PATIENT
 # ---------------------
@@ -128,6 +162,7 @@ if __name__ == "__main__":
 
     # Lecture du patient créé
     test_get_patient(pid)
+    test_get_patient_fields(pid)
 
     # Mise à jour
     test_update_patient(pid)
@@ -137,9 +172,13 @@ if __name__ == "__main__":
 
     # Export du patient individuel
     test_export_patient_folder("MV001")
+    test_export_patient_cached("MV001")
 
     # Export multiple (tu peux en ajouter d’autres)
     test_export_multiple_patients(["MV002", "MV001"])
 
+    # Export analytique (Parquet)
+    test_export_cohort(["MV002", "MV001"])
+
     # Suppression du patient
     test_delete_patient(pid)
@@ -101,6 +101,7 @@ def upload_multiple_photos(id_operation, files_paths):
         print("Response:", data)
         if data.get("status") != "success":
             raise RuntimeError("Upload multiple photos failed")
+        print("Skipped duplicates:", data.get("skipped_duplicates", []))
         return data["photos"]
     finally:
         for _, f in files:
@@ -117,6 +118,45 @@ def get_photos(id_operation):
     print("Count:", len(data.get("photos", [])))
     return data.get("photos", [])
 
+# ---------------------
+# LIST PHOTOS + STREAM ONE PHOTO
+# ---------------------
+def list_photos(id_operation):
+    p("LIST PHOTOS (METADATA)")
+    r = requests.get(f"{PHOTOS_URL}/list/{id_operation}")
+    data = must_json(r)
+    print("Status:", r.status_code)
+    for item in data.get("photos", []):
+        print(" -", item["filename"], item["size"], "bytes", item["etag"])
+    if any("image_base64" in item for item in data.get("photos", [])):
+        raise RuntimeError("Metadata listing should not embed image data")
+    return data.get("photos", [])
+
+def check_photo_file(photo):
+    p(f"STREAM PHOTO: {photo['filename']}")
+    url = f"{API_BASE}{photo['url']}"
+
+    r = requests.get(url)
+    print("Full:", r.status_code, r.headers.get("Content-Type"), len(r.content), "bytes")
+    if r.status_code != 200 or len(r.content) != photo["size"]:
+        raise RuntimeError("Full photo download failed")
+
+    r = requests.get(url, headers={"If-None-Match": photo["etag"]})
+    print("If-None-Match:", r.status_code)
+    if r.status_code != 304:
+        raise RuntimeError("Expected 304 for a matching ETag")
+
+    r = requests.get(url, headers={"Range": "bytes=0-99"})
+    print("Range:", r.status_code, r.headers.get("Content-Range"), len(r.content), "bytes")
+    if r.status_code != 206 or len(r.content) != min(100, photo["size"]):
+        raise RuntimeError("Range request failed")
+
+    for size, thumb_url in photo.get("thumbnails", {}).items():
+        r = requests.get(f"{API_BASE}{thumb_url}")
+        print(f"Thumbnail {size}:", r.status_code, r.headers.get("Content-Type"), len(r.content), "bytes")
+        if r.status_code != 200 or len(r.content) > photo["size"]:
+            raise RuntimeError(f"Thumbnail {size} failed")
+
 # ---------------------
 # DELETE PHOTO
 # ---------------------
@@ -169,6 +209,10 @@ if __name__ == "__main__":
         photos = get_photos(id_operation)
         print("Photos currently stored:", [p["filename"] for p in photos])
 
+        listed = list_photos(id_operation)
+        if listed:
+            check_photo_file(listed[0])
+
         # Supprime toutes les photos
         for photo_item in photos:
             delete_photo(id_operation, photo_item["filename"])
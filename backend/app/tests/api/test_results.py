@@ -1,4 +1,8 @@
 import requests
+import subprocess
+import sys
+import threading
+import time
 from pathlib import Path
 from datetime import date
 
@@ -105,6 +109,147 @@ def get_plot_data(id_operation, position):
     print("Points:", len(data))
     return data
 
+def get_plot_data_columnar(id_operation, position):
+    p("GET PLOT DATA (COLUMNAR)")
+    r = requests.get(f"{RESULTS_URL}/plot-data-by-position/{id_operation}/{position}", params={"format": "columnar"})
+    print("Status:", r.status_code)
+    data = must_json(r)
+    graph = data.get("graph_data", {})
+    if not isinstance(graph, dict) or "freq" not in graph:
+        raise RuntimeError("Expected columnar graph_data with a freq array")
+    for key, values in graph.get("series", {}).items():
+        if len(values) != len(graph["freq"]):
+            raise RuntimeError(f"Series {key} does not match the freq axis")
+    print("Points:", len(graph["freq"]), "Series:", list(graph.get("series", {})))
+    return data
+
+def get_plot_data_downsampled(id_operation, position, max_points=100):
+    p("GET PLOT DATA (DOWNSAMPLED)")
+    r = requests.get(
+        f"{RESULTS_URL}/plot-data-by-position/{id_operation}/{position}",
+        params={"format": "columnar", "max_points": max_points},
+    )
+    print("Status:", r.status_code)
+    data = must_json(r)
+    n_points = len(data.get("graph_data", {}).get("freq", []))
+    print("Points:", n_points)
+    if n_points > max_points:
+        raise RuntimeError(f"Expected at most {max_points} points, got {n_points}")
+    return data
+
+def synthetic_sweep_csv(seed, n_points=2001):
+    # Balayages tous différents : les uploads identiques sont dédupliqués par SHA-256
+    lines = ["Freq(Hz),Return Loss(dB)"]
+    for i in range(n_points):
+        freq = 1_000_000 + i * 1_000
+        loss = -3 - 15 * (1 - abs(i - 800 - seed) / n_points) - seed * 1e-3
+        lines.append(f"{freq},{loss:.6f}")
+    return "\n".join(lines).encode("utf-8")
+
+def check_reads_during_upload(id_operation, position=2, n_files=40):
+    p("CONCURRENT READS DURING UPLOAD")
+    upload_done = threading.Event()
+
+    def big_upload():
+        files = [
+            ("files", (f"concurrency_{i:03d}.csv", synthetic_sweep_csv(i), "text/csv"))
+            for i in range(n_files)
+        ]
+        try:
+            requests.post(f"{RESULTS_URL}/process-results/{id_operation}/{position}", files=files)
+        finally:
+            upload_done.set()
+
+    uploader = threading.Thread(target=big_upload)
+    uploader.start()
+    time.sleep(0.5)
+
+    served_during_upload = 0
+    while not upload_done.is_set():
+        t0 = time.time()
+        r = requests.get(f"{OPERATIONS_URL}/{id_operation}", timeout=5)
+        if r.status_code == 200 and not upload_done.is_set():
+            served_during_upload += 1
+            print(f"GET served in {time.time() - t0:.3f}s while upload in progress")
+        time.sleep(0.1)
+
+    uploader.join()
+    print("Reads served during upload:", served_during_upload)
+    if served_during_upload == 0:
+        raise RuntimeError("No GET request was served while the upload was running")
+    return served_during_upload
+
+def check_duplicate_upload(id_operation, position=1):
+    p("DUPLICATE UPLOAD IS SKIPPED")
+    before = len(get_results_by_op_pos(id_operation, position))
+    with open(TEST_FILE, "rb") as f:
+        files = [("files", (TEST_FILE.name, f, "application/vnd.ms-excel"))]
+        r = requests.post(f"{RESULTS_URL}/process-results/{id_operation}/{position}", files=files)
+    data = must_json(r)
+    print("Response:", data)
+    after = len(get_results_by_op_pos(id_operation, position))
+    if data.get("skipped_duplicates") != [TEST_FILE.name] or after != before:
+        raise RuntimeError("Re-uploading the same file should not create a new result")
+    return data
+
+def check_reprocess_keeps_upload_order(patient_id, id_operation, position=3):
+    # Upload hors ordre alphabétique : measurement_number suit l'upload, pas le nom de fichier
+    p("REPROCESS KEEPS FILE -> RESULT MAPPING")
+    for name, seed in (("z_sweep.csv", 70), ("a_sweep.csv", 10)):
+        files = [("files", (name, synthetic_sweep_csv(seed), "text/csv"))]
+        requests.post(f"{RESULTS_URL}/process-results/{id_operation}/{position}", files=files)
+    before = [(r["measurement_number"], r["min_return_loss_db"]) for r in get_results_by_op_pos(id_operation, position)]
+
+    # Le job tourne contre la même base que le serveur
+    subprocess.run(
+        [sys.executable, "-m", "app.jobs.reprocess_results", "--patient", patient_id],
+        cwd=BASE_DIR.parents[2], check=True,
+    )
+    after = [(r["measurement_number"], r["min_return_loss_db"]) for r in get_results_by_op_pos(id_operation, position)]
+    print("Before:", before)
+    print("After: ", after)
+    if before != after:
+        raise RuntimeError("Reprocessing swapped metrics between measurements")
+    return after
+
+def check_delete_keeps_upload_order(id_operation, position=3):
+    # Suite de check_reprocess_keeps_upload_order : la mesure 1 est z_sweep.csv
+    p("DELETE REMOVES THE MEASUREMENT'S OWN FILE")
+    delete_measurement(id_operation, position, 1)
+    rows = get_results_by_op_pos(id_operation, position)
+    print("Remaining:", [(r["measurement_number"], r["file_name"]) for r in rows])
+    if [r["file_name"] for r in rows] != ["a_sweep.csv"]:
+        raise RuntimeError("Deleting measurement 1 removed another measurement's file")
+    return rows
+
+def check_patient_plot_query_count(patient_id, position=1, max_queries=2):
+    p("PATIENT PLOT QUERY COUNT")
+    # Run from backend/ (python -m app.tests.api.test_results) so that app.* is importable
+    from sqlalchemy import event
+    from app.db.database import SessionLocal, engine
+    from app.api.results import load_patient_visits
+
+    # First call may materialize missing position averages, it is not counted
+    r = requests.get(f"{RESULTS_URL}/plot-data-by-patient/{patient_id}/{position}")
+    print("Status:", r.status_code)
+
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    db = SessionLocal()
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        visits = load_patient_visits(db, patient_id, position)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+        db.close()
+
+    print("Visits:", len(visits), "Queries:", len(statements))
+    if len(statements) > max_queries:
+        raise RuntimeError(f"Visit loader issued {len(statements)} queries, expected at most {max_queries}")
+    return len(statements)
+
 def delete_measurement(id_operation, position, measurement_number):
     p("DELETE MEASUREMENT")
     payload = {
@@ -146,6 +291,13 @@ if __name__ == "__main__":
         _ = get_results_by_patient(patient_id)
         op_pos_data = get_results_by_op_pos(id_operation, 1)
         _ = get_plot_data(id_operation, 1)
+        _ = get_plot_data_columnar(id_operation, 1)
+        _ = get_plot_data_downsampled(id_operation, 1)
+        _ = check_patient_plot_query_count(patient_id, 1)
+        _ = check_reads_during_upload(id_operation)
+        _ = check_duplicate_upload(id_operation, 1)
+        _ = check_reprocess_keeps_upload_order(patient_id, id_operation)
+        _ = check_delete_keeps_upload_order(id_operation)
 
         if isinstance(op_pos_data, list) and op_pos_data:
             last = op_pos_data[-1]
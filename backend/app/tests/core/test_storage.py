@@ -0,0 +1,100 @@
+import io
+import os
+import tempfile
+
+# Racine temporaire avant tout import de app.* : la valeur par défaut de DATA_ROOT
+# (chemin Windows) deviendrait un dossier relatif dans le checkout sous Linux.
+os.environ.setdefault("DATA_ROOT", tempfile.mkdtemp(prefix="lymphtrack-test-"))
+
+import boto3
+from moto import mock_aws
+
+from app.core.storage import LocalStorage, S3Storage, StorageBackend
+
+# ---------------------
+# STORAGE BACKENDS (local + S3 mocked by moto)
+# ---------------------
+# Mêmes vérifications sur les deux backends ; aucun service externe n'est contacté.
+#   python -m app.tests.core.test_storage   (depuis backend/)
+
+BUCKET = "lymphtrack-test"
+
+
+def p(title):
+    print("\n" + "=" * 12, title, "=" * 12)
+
+
+def check_backend(storage):
+    storage.save("MV001/1/1/b.csv", io.BytesIO(b"b" * 10))
+    storage.save("MV001/1/1/a.csv", io.BytesIO(b"a" * 5))
+    storage.save("MV001/1/photos/x.jpg", io.BytesIO(b"jpeg"))
+
+    # open / read
+    with storage.open("MV001/1/1/a.csv") as f:
+        assert f.read() == b"aaaaa"
+    assert storage.read_bytes("MV001/1/1/b.csv") == b"b" * 10
+    assert b"".join(storage.iter_range("MV001/1/1/b.csv", 2, 3)) == b"bbb"
+
+    # stat
+    stored = storage.stat("MV001/1/1/b.csv")
+    assert stored.key == "MV001/1/1/b.csv" and stored.size == 10 and stored.mtime_ns > 0
+    assert storage.stat("MV001/1/1/missing.csv") is None
+
+    # list (trié, non récursif par défaut)
+    assert [f.key for f in storage.list_files("MV001/1/1")] == ["MV001/1/1/a.csv", "MV001/1/1/b.csv"]
+    assert storage.list_files("MV001/1") == []
+    assert len(storage.list_files("MV001", recursive=True)) == 3
+
+    # is_dir : préfixe avec contenu, préfixe créé vide, préfixe inexistant, nom partiel
+    assert storage.is_dir("MV001/1/1")
+    assert storage.is_dir("MV001")
+    assert not storage.is_dir("MV002")
+    assert not storage.is_dir("MV001/1/2")
+    assert not storage.is_dir("MV00")
+    storage.make_dirs("MV001/1/2")
+    assert storage.is_dir("MV001/1/2")
+    assert storage.list_files("MV001/1/2") == []
+
+    # delete / delete_prefix
+    storage.delete("MV001/1/1/a.csv")
+    assert not storage.exists("MV001/1/1/a.csv")
+    storage.delete_prefix("MV001/1")
+    assert storage.list_files("MV001", recursive=True) == []
+    assert not storage.is_dir("MV001/1")
+    assert not storage.is_dir("MV001/1/2")
+
+
+def test_local_storage():
+    p("LOCAL STORAGE")
+    with tempfile.TemporaryDirectory() as root:
+        check_backend(LocalStorage(root))
+    print("OK")
+
+
+@mock_aws
+def test_s3_storage():
+    p("S3 STORAGE (moto)")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+    check_backend(S3Storage(BUCKET, prefix="archive", region="us-east-1"))
+    print("OK")
+
+
+def test_incomplete_backend():
+    p("INCOMPLETE BACKEND")
+    # Backend sans is_dir : refusé à l'instanciation, pas à la première requête
+    methods = {name: lambda self, *args: None for name in StorageBackend.__abstractmethods__ - {"is_dir"}}
+    NoIsDir = type("NoIsDir", (StorageBackend,), methods)
+    try:
+        NoIsDir()
+    except TypeError as e:
+        print("Rejected:", e)
+    else:
+        raise AssertionError("Backend without is_dir was instantiated")
+
+
+if __name__ == "__main__":
+    test_local_storage()
+    test_s3_storage()
+    test_incomplete_backend()
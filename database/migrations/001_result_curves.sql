@@ -0,0 +1,12 @@
+-- Full S11 sweeps stored alongside the scalar metrics of each result.
+-- freq_hz / loss_db: little-endian float64 arrays, zlib-compressed.
+CREATE TABLE IF NOT EXISTS result_curves (
+    id SERIAL PRIMARY KEY,
+    result_id INTEGER NOT NULL UNIQUE REFERENCES results(id) ON DELETE CASCADE,
+    n_points INTEGER NOT NULL,
+    freq_hz BYTEA NOT NULL,
+    loss_db BYTEA NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_results_operation_position
+    ON results (id_operation, position, measurement_number);
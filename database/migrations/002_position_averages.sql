@@ -0,0 +1,12 @@
+-- Materialized average curve of each (operation, position), maintained on upload/delete.
+-- freq_hz / loss_sum: float64, point_count: int32, all zlib-compressed.
+CREATE TABLE IF NOT EXISTS position_averages (
+    id_operation INTEGER NOT NULL REFERENCES operations(id_operation) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    n_measurements INTEGER NOT NULL DEFAULT 0,
+    freq_hz BYTEA NOT NULL,
+    loss_sum BYTEA NOT NULL,
+    point_count BYTEA NOT NULL,
+    updated_at TIMESTAMPTZ,
+    PRIMARY KEY (id_operation, position)
+);
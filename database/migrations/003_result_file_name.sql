@@ -0,0 +1,4 @@
+-- Name of the archived file behind each result, used to find a measurement's file and
+-- by the reprocess job to match files to their rows (measurement numbers follow
+-- upload order, not file names). Rows from older uploads keep it NULL.
+ALTER TABLE results ADD COLUMN IF NOT EXISTS file_name VARCHAR;
@@ -0,0 +1,13 @@
+-- Persisted visit order / folder name of each operation (see app/core/visits.py).
+ALTER TABLE operations ADD COLUMN IF NOT EXISTS visit_number INTEGER;
+ALTER TABLE operations ADD COLUMN IF NOT EXISTS visit_str VARCHAR;
+
+UPDATE operations o
+SET visit_number = v.n,
+    visit_str = v.n || '-' || replace(o.name, ' ', '_') || '_' || to_char(o.operation_date, 'DDMMYYYY')
+FROM (
+    SELECT id_operation,
+           ROW_NUMBER() OVER (PARTITION BY patient_id ORDER BY operation_date, id_operation) AS n
+    FROM operations
+) v
+WHERE o.id_operation = v.id_operation;
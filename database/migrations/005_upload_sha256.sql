@@ -0,0 +1,6 @@
+-- SHA-256 of each uploaded file, used to skip files already uploaded for the same operation.
+ALTER TABLE results ADD COLUMN IF NOT EXISTS sha256 VARCHAR(64);
+ALTER TABLE photos ADD COLUMN IF NOT EXISTS sha256 VARCHAR(64);
+
+CREATE INDEX IF NOT EXISTS ix_results_operation_sha256 ON results (id_operation, sha256);
+CREATE INDEX IF NOT EXISTS ix_photos_operation_sha256 ON photos (id_operation, sha256);
@@ -0,0 +1,3 @@
+-- Indexes backing the keyset-paginated list filters (GET /operations/?patient_id=..., GET /results/?patient_id=...).
+CREATE INDEX IF NOT EXISTS ix_operations_patient ON operations (patient_id, id_operation);
+CREATE INDEX IF NOT EXISTS ix_operations_date ON operations (operation_date);